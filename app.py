@@ -1,25 +1,67 @@
 ﻿# -*- coding: utf-8 -*-
+import csv
+import hashlib
+import hmac
+import io
 import os
 import uuid
-from urllib.parse import quote
 
-import requests
-from flask import Flask, render_template, request, redirect, url_for, session, abort
+from flask import Flask, Response, render_template, request, redirect, url_for, session, abort, flash, g, send_from_directory
 
-from services.shiplogic_rates import get_rates, normalize_zone
+# settings first: it loads .env into os.environ before other modules read it
+from services import settings
+from services import admission, catalog, http_cache, http_client, images, inventory, metrics, orders, pay_dedup, postcodes, profiler, rate_card, tasks, yoco_webhook
+from services.cart import Cart
+from services.catalog import cents_to_zar
+from services.rate_cache import qty_bucket, quote_cache, value_bucket
+from services.session_store import make_session_interface
+from services.carriers import RateQuote, from_session
+from services.quoting import quote_all
+from services.shiplogic_rates import normalize_zone
+
+# yoco_start is locked (tools/check_yoco_lock.py) and calls `requests.post`;
+# binding the name to the pooled client moves it onto keep-alive connections.
+requests = http_client
 
 app = Flask(__name__)
 
-app.secret_key = os.getenv("FLASK_SECRET_KEY") or os.getenv("SECRET_KEY") or "dev-secret-change-me"
+app.secret_key = settings.current().secret_key
+
+# Cart, details and courier quotes stay server-side; the cookie only holds an id.
+_session_interface = make_session_interface()
+if _session_interface is not None:
+    app.session_interface = _session_interface
 
-WHATSAPP_NUMBER = os.getenv("WHATSAPP_NUMBER", "27645277314")
-ADMIN_KEY = os.getenv("ADMIN_KEY", "1234")
+metrics.init_app(app)
+profiler.init_app(app)
+http_cache.init_app(app)
+app.jinja_env.globals["picture"] = images.picture
+metrics.register("quote_reuse_total", "counter", "Cart/details changes that kept the existing courier quote.")
+metrics.register("quote_invalidations_total", "counter", "Cart/details changes that dropped the courier quote.")
+rate_card.start_refresher()
+
+WHATSAPP_NUMBER = settings.current().whatsapp_number
+ADMIN_KEY = settings.current().admin_key
+# "Only N left" shows at or below this many units.
+LOW_STOCK = settings.current().low_stock
 
 # Yoco
 YOCO_SECRET_KEY = os.getenv("YOCO_SECRET_KEY", "")
 PUBLIC_URL = os.getenv("PUBLIC_URL", "http://127.0.0.1:5000").rstrip("/")
 YOCO_CHECKOUT_URL = "https://payments.yoco.com/api/checkouts"
 
+@settings.on_reload
+def _apply_settings(cfg):
+    # in-process reload (dev server SIGHUP); gunicorn replaces workers instead
+    app.secret_key = cfg.secret_key
+    globals().update({
+        "WHATSAPP_NUMBER": cfg.whatsapp_number,
+        "ADMIN_KEY": cfg.admin_key,
+        "LOW_STOCK": cfg.low_stock,
+        "YOCO_SECRET_KEY": cfg.yoco_secret_key,
+        "PUBLIC_URL": cfg.public_url,
+    })
+
 PROVINCES = [
     "Gauteng (GP)",
     "Western Cape (WC)",
@@ -32,60 +74,104 @@ PROVINCES = [
     "Northern Cape (NC)",
 ]
 
-PRODUCTS = [
-    {"id": "gin", "name": "First Pour – London Dry Gin", "price": 35000, "price_display": "R350", "desc": "Crisp · Aromatic · Classic", "img": "first-pour-gin.jpg"},
-    {"id": "vodka", "name": "First Pour – Vanilla Vodka", "price": 35000, "price_display": "R350", "desc": "Smooth · Sweet · Velvety", "img": "first-pour-vodka.jpg"},
-    {"id": "whitewine", "name": "First Pour – Sweet White Wine", "price": 20000, "price_display": "R200", "desc": "Light · Juicy · Sweet", "img": "first-pour-white-wine.jpg"},
-    {"id": "redwine","name": "First Pour – Sweet Red Wine","price": 20000,"price_display": "R200","desc": "Smooth · Juicy · Sweet","img": "first-pour-red-wine.jpg"},   
+QUOTE_UNAVAILABLE = "Courier prices are unavailable right now. Please try again in a few minutes, or choose pickup."
+QUOTE_OUTDATED = "Your cart or delivery address changed, so the courier price no longer applies. Please get a new quote."
+QUOTE_MISSING = "Please get a courier quote before paying, or choose pickup."
+# Shown when admission control turns a request away, by reason.
+TOO_FAST = "You're going a little fast. Please wait {seconds} seconds and try again."
+TOO_BUSY = {
+    "courier_quote": "We're getting a lot of delivery quote requests right now. Please try again in a moment, or choose pickup.",
+    "yoco_start": "Payments are very busy right now. Please try again in a moment.",
+}
 
-]
+# "Gauteng" -> "Gauteng (GP)", for turning postcode-index zones back into dropdown values
+PROVINCE_BY_ZONE = {normalize_zone(p): p for p in PROVINCES}
 
 def product_by_id(pid: str):
-    for p in PRODUCTS:
-        if p["id"] == pid:
-            return p
-    return None
+    return catalog.current().by_id.get(pid)
+
+def priced_cart(cart: dict = None) -> Cart:
+    """
+    The session cart priced once per request. Routes (and the helpers below)
+    share this object instead of re-walking the cart.
+    """
+    if cart is None:
+        cart = session.get("cart", {})
+    snap = catalog.current()
+    key = (snap.version, tuple(cart.items()))
+    memo = g.get("_priced_cart")
+    if memo is not None and memo[0] == key:
+        return memo[1]
+    priced = Cart(cart, snap)
+    g._priced_cart = (key, priced)
+    return priced
 
 def cart_total_cents(cart: dict) -> int:
-    total = 0
-    for pid, qty in cart.items():
-        p = product_by_id(pid)
-        if not p:
-            continue
-        try:
-            q = int(qty)
-        except:
-            q = 0
-        if q > 0:
-            total += p["price"] * q
-    return total
+    return priced_cart(cart).subtotal_cents
 
 def cart_lines(cart: dict):
-    lines = []
-    for pid, qty in cart.items():
-        p = product_by_id(pid)
-        if not p:
-            continue
-        try:
-            q = int(qty)
-        except:
-            q = 0
-        if q <= 0:
-            continue
-        lines.append({"id": pid, "name": p["name"], "qty": q, "unit_cents": p["price"], "unit_display": p["price_display"], "line_cents": p["price"] * q})
-    return lines
-
-def cents_to_zar(cents: int) -> str:
-    return f"R{cents/100:.2f}".replace(".00", "")
-
-def cart_count(cart: dict) -> int:
-    c = 0
-    for _, qty in cart.items():
-        try:
-            c += int(qty)
-        except:
-            pass
-    return c
+    return priced_cart(cart).lines
+
+def _session_stock() -> dict:
+    """
+    inventory.available() as this shopper sees it: units their own unpaid
+    checkout holds are theirs to keep or change, so they count as free.
+    """
+    stock = inventory.available()
+    mine = inventory.held(session.get("order_id", ""))
+    if not mine:
+        return stock
+    return {pid: n + mine.get(pid, 0) for pid, n in stock.items()}
+
+def _clear_quote():
+    # no quote, no courier: yoco_start would otherwise charge courier delivery at R0
+    if session.get("delivery_method") == "courier_guy":
+        session["delivery_method"] = "pickup"
+    session["delivery_fee_cents"] = 0
+    session["cg_quote"] = None
+    session["cg_rates"] = []
+    session["cg_estimate"] = False
+    session["cg_quote_source"] = ""
+    session["cg_quote_fp"] = ""
+
+def _quote_fingerprint(priced: Cart, source: str) -> str:
+    """
+    Hash of exactly what a courier price depends on: delivery area, zone,
+    and the parcel. A live quote was priced for this bottle count and
+    declared value; a rate-card cell covers its whole band (it is priced at
+    the top of it). Name, phone, email and street don't change the price, so
+    editing them keeps the quote.
+    """
+    province = session.get("cg_province") or "Gauteng (GP)"
+    declared = max(1, int(round(priced.subtotal_cents / 100)))
+    if source == "rate_card":
+        parcel = [qty_bucket(priced.bottle_count), value_bucket(declared)]
+    else:
+        parcel = [str(priced.bottle_count), str(declared)]
+    parts = [
+        " ".join((session.get("cg_suburb") or "").lower().split()),
+        " ".join((session.get("cg_city") or "").lower().split()),
+        (session.get("cg_postal") or "").strip(),
+        normalize_zone(_province_code_from_label(province)),
+        *parcel,
+    ]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+def _keep_quote_if_still_valid():
+    """
+    Drops the stored quote only when its fingerprint no longer matches.
+    """
+    fp = session.get("cg_quote_fp")
+    if not fp:
+        return
+    if fp == _quote_fingerprint(priced_cart(), session.get("cg_quote_source", "")):
+        metrics.inc("quote_reuse_total", route=request.endpoint)
+        return
+    metrics.inc("quote_invalidations_total", route=request.endpoint)
+    was_courier = session.get("delivery_method") == "courier_guy"
+    _clear_quote()
+    if was_courier:
+        session["cg_error"] = QUOTE_OUTDATED
 
 def _province_code_from_label(label: str) -> str:
     s = (label or "").strip()
@@ -93,32 +179,23 @@ def _province_code_from_label(label: str) -> str:
         return s.split("(")[-1].split(")")[0].strip()
     return s
 
-def _extract_rates_list(data: dict):
-    if not isinstance(data, dict):
-        return []
-    for k in ["rates", "service_levels", "results", "data"]:
-        v = data.get(k)
-        if isinstance(v, list):
-            return v
-    return []
-
-def _rate_name(item: dict) -> str:
-    return item.get("service_level_name") or item.get("service_level") or item.get("name") or item.get("courier") or "Courier"
-
-def _rate_amount_to_cents(item: dict) -> int:
-    amount = item.get("total") or item.get("total_price") or item.get("price") or item.get("rate") or item.get("amount") or 0
-    try:
-        amt = float(amount)
-    except:
-        amt = 0.0
-    # assume rands if small, cents if huge
-    if amt <= 10000:
-        return int(round(amt * 100))
-    return int(round(amt))
-
 @app.route("/")
 def index():
-    return render_template("index.html", products=PRODUCTS, whatsapp_number=WHATSAPP_NUMBER)
+    snap = catalog.current()
+    stock = inventory.available()
+
+    def render():
+        return render_template(
+            "index.html",
+            products=snap.products,
+            stock=stock,
+            low_stock=LOW_STOCK,
+            whatsapp_number=WHATSAPP_NUMBER,
+        )
+
+    if session.get("_flashes"):
+        return render()  # one-off messages: don't cache or 304 this one
+    return http_cache.cached_page(("index", snap.version, images.version(), tuple(sorted(stock.items()))), render)
 
 @app.route("/cart/add", methods=["POST"])
 def cart_add():
@@ -127,6 +204,8 @@ def cart_add():
 
     p = product_by_id(pid)
     if not p:
+        if _wants_json():
+            return _checkout_state(404, error="Unknown product.")
         return redirect(url_for("index"))
 
     try:
@@ -136,25 +215,37 @@ def cart_add():
     qty_i = max(1, min(99, qty_i))
 
     cart = session.get("cart", {})
+    left = _session_stock().get(pid)
+    if left is not None:
+        room = left - int(cart.get(pid, 0))
+        if room <= 0:
+            message = f"Sorry, {p['name']} is sold out." if left == 0 else f"You already have the last {left} of {p['name']} in your cart."
+            if _wants_json():
+                return _checkout_state(409, error=message)
+            flash(message)
+            return redirect(url_for("index"))
+        if qty_i > room:
+            qty_i = room
+            session["cg_error"] = f"Only {left} of {p['name']} left, so your cart has {int(cart.get(pid, 0)) + room}."
     cart[pid] = int(cart.get(pid, 0)) + qty_i
     session["cart"] = cart
+    _keep_quote_if_still_valid()
 
-    return redirect(url_for("checkout"))
+    return _back_to_checkout()
 
 @app.route("/cart/clear", methods=["POST"])
 def cart_clear():
     session["cart"] = {}
-    session["delivery_fee_cents"] = 0
-    session["cg_quote_raw"] = None
     session["cg_error"] = ""
-    session["cg_rates"] = []
-    return redirect(url_for("checkout"))
+    _keep_quote_if_still_valid()
+    return _back_to_checkout()
 
-@app.route("/checkout", methods=["GET"])
-def checkout():
-    cart = session.get("cart", {})
-    lines = cart_lines(cart)
-    subtotal = cart_total_cents(cart)
+def _checkout_context(priced: Cart) -> dict:
+    """
+    Everything checkout.html shows that depends on the cart, quote and
+    delivery choice.
+    """
+    subtotal = priced.subtotal_cents
 
     delivery_method = session.get("delivery_method", "pickup")
 
@@ -168,10 +259,72 @@ def checkout():
 
     total = subtotal + delivery_fee
 
-    cg_error = session.get("cg_error", "")
-    cg_quote_raw = session.get("cg_quote_raw", None)
-    cg_quote_text = _rate_name(cg_quote_raw) if isinstance(cg_quote_raw, dict) else ""
+    cg_quote = from_session(session.get("cg_quote"))
+    cg_quote_text = cg_quote.service if cg_quote else ""
+    cg_estimate = bool(session.get("cg_estimate")) and bool(cg_quote_text)
 
+    return dict(
+        lines=priced.lines,
+        cart_count=priced.item_count,
+        subtotal_display=cents_to_zar(subtotal),
+        delivery_method=delivery_method,
+        delivery_fee_display=cents_to_zar(delivery_fee),
+        total_display=cents_to_zar(total),
+        total_cents=total,
+        cg_error=session.get("cg_error", ""),
+        cg_quote_text=cg_quote_text,
+        cg_estimate=cg_estimate,
+        stock=_session_stock(),
+        whatsapp_text=priced.whatsapp_text(delivery_fee),
+    )
+
+def _wants_json() -> bool:
+    return request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json"
+
+def _checkout_state(status: int = 200, **extra):
+    """
+    JSON for the checkout page to update itself in place after an action:
+    the same values the template shows, minus the form fields.
+    """
+    ctx = _checkout_context(priced_cart())
+    stock = ctx["stock"]
+    state = {
+        "ok": status < 400,
+        "cart_count": ctx["cart_count"],
+        "lines": [
+            {
+                "id": l.id,
+                "name": l.name,
+                "qty": l.qty,
+                "unit_display": l.unit_display,
+                "line_display": cents_to_zar(l.line_cents),
+                "stock_left": stock.get(l.id),
+            }
+            for l in ctx["lines"]
+        ],
+        "subtotal_display": ctx["subtotal_display"],
+        "delivery_method": ctx["delivery_method"],
+        "delivery_fee_display": ctx["delivery_fee_display"],
+        "total_display": ctx["total_display"],
+        "total_cents": ctx["total_cents"],
+        "error": ctx["cg_error"],
+        "quote": {"service": ctx["cg_quote_text"], "estimate": ctx["cg_estimate"]} if ctx["cg_quote_text"] else None,
+        "whatsapp_url": f"https://wa.me/{WHATSAPP_NUMBER}?text={ctx['whatsapp_text']}",
+    }
+    state.update(extra)
+    return state, status
+
+def _back_to_checkout():
+    """
+    Ends a checkout action: JSON state for fetch() callers, the usual
+    redirect for plain form posts.
+    """
+    if _wants_json():
+        return _checkout_state()
+    return redirect(url_for("checkout"))
+
+@app.route("/checkout", methods=["GET"])
+def checkout():
     customer_name = session.get("customer_name", "")
     customer_phone = session.get("customer_phone", "")
     customer_email = session.get("customer_email", "")
@@ -182,28 +335,13 @@ def checkout():
     cg_postal = session.get("cg_postal", "")
     cg_province = session.get("cg_province", "Gauteng (GP)")
 
-    whatsapp_text = "Hi First Pour. I want to order:%0A"
-    for l in lines:
-        whatsapp_text += f"- {quote(l['name'])} x{l['qty']}%0A"
-    whatsapp_text += (
-        f"%0ASubtotal: {quote(cents_to_zar(subtotal))}"
-        f"%0ADelivery: {quote(cents_to_zar(delivery_fee))}"
-        f"%0ATotal: {quote(cents_to_zar(total))}"
-    )
+    if "pay_token" not in session:
+        session["pay_token"] = uuid.uuid4().hex
 
     return render_template(
         "checkout.html",
         whatsapp_number=WHATSAPP_NUMBER,
-        lines=lines,
-        cart_count=cart_count(cart),
-        subtotal_display=cents_to_zar(subtotal),
-        delivery_method=delivery_method,
-        delivery_fee_display=cents_to_zar(delivery_fee),
-        total_display=cents_to_zar(total),
-        total_cents=total,
         yoco_enabled=bool(YOCO_SECRET_KEY),
-        cg_error=cg_error,
-        cg_quote_text=cg_quote_text,
         provinces=PROVINCES,
         customer_name=customer_name,
         customer_phone=customer_phone,
@@ -213,7 +351,7 @@ def checkout():
         cg_city=cg_city,
         cg_postal=cg_postal,
         cg_province=cg_province,
-        whatsapp_text=whatsapp_text,
+        **_checkout_context(priced_cart()),
     )
 
 @app.route("/checkout/details", methods=["POST"])
@@ -228,29 +366,26 @@ def checkout_details():
     session["cg_suburb"] = request.form.get("cg_suburb", "").strip()
     session["cg_city"] = request.form.get("cg_city", "").strip()
     session["cg_postal"] = request.form.get("cg_postal", "").strip()
-    session["cg_province"] = request.form.get("cg_province", "Gauteng (GP)").strip()
-
-    # clear previous quote whenever details change
-    session["delivery_fee_cents"] = 0
-    session["cg_quote_raw"] = None
+    province = request.form.get("cg_province", "").strip()
+    if not province:
+        # no province picked: infer it from a known postal code
+        zone = postcodes.index().zone_for_code(session["cg_postal"])
+        province = PROVINCE_BY_ZONE.get(zone, "Gauteng (GP)")
+    session["cg_province"] = province
+
+    # keep the quote unless something it was priced on changed
     session["cg_error"] = ""
-    session["cg_rates"] = []
+    _keep_quote_if_still_valid()
 
-    return redirect(url_for("checkout"))
-
-@app.route("/courier/quote", methods=["POST"])
-def courier_quote():
-    session["cg_error"] = ""
-    session["cg_quote_raw"] = None
-    session["delivery_fee_cents"] = 0
-    session["cg_rates"] = []
+    return _back_to_checkout()
 
-    cart = session.get("cart", {})
-    lines = cart_lines(cart)
-    subtotal_cents = cart_total_cents(cart)
-    if subtotal_cents <= 0:
-        session["cg_error"] = "Cart empty. Add items first."
-        return redirect(url_for("checkout"))
+def _delivery_request(priced: Cart):
+    """
+    (delivery_address, declared_value_rands, error) for a quote from the
+    session's cart and delivery details; error is "" when it's quotable.
+    """
+    if priced.subtotal_cents <= 0:
+        return None, 0, "Cart empty. Add items first."
 
     street = (session.get("cg_street") or "").strip()
     suburb = (session.get("cg_suburb") or "").strip()
@@ -259,12 +394,16 @@ def courier_quote():
     province_label = (session.get("cg_province") or "Gauteng (GP)").strip()
 
     if not street or not suburb or not city or not code:
-        session["cg_error"] = "Fill Street, Suburb, City, and Postal code before quoting."
-        return redirect(url_for("checkout"))
+        return None, 0, "Fill Street, Suburb, City, and Postal code before quoting."
 
     province_code = _province_code_from_label(province_label)
     zone = normalize_zone(province_code)
 
+    # catch impossible addresses locally instead of paying for a round trip
+    problem = postcodes.index().check(code, zone)
+    if problem:
+        return None, 0, problem
+
     delivery_address = {
         "type": "residential",
         "company": "",
@@ -274,39 +413,276 @@ def courier_quote():
         "zone": zone,
         "country": "ZA",
         "code": code,
-        "_total_qty": sum([int(l["qty"]) for l in lines]) if lines else 1,
+        "_total_qty": priced.bottle_count,
     }
 
-    declared_value_rands = max(1, int(round(subtotal_cents / 100)))
+    declared_value_rands = max(1, int(round(priced.subtotal_cents / 100)))
+    return delivery_address, declared_value_rands, ""
 
-    try:
-        data = get_rates(delivery_address=delivery_address, declared_value=declared_value_rands)
-        raw_rates = _extract_rates_list(data)
-        if not raw_rates:
-            session["cg_error"] = f"No rates returned. Response: {data}"
-            return redirect(url_for("checkout"))
-
-        normalized = []
-        for item in raw_rates:
-            if not isinstance(item, dict):
-                continue
-            fee_cents = _rate_amount_to_cents(item)
-            normalized.append({"name": _rate_name(item), "fee_cents": max(0, int(fee_cents)), "raw": item})
-
-        normalized.sort(key=lambda x: x["fee_cents"])
-        best = normalized[0]
+@app.route("/courier/quote", methods=["POST"])
+def courier_quote():
+    session["cg_error"] = ""
+    _clear_quote()
+
+    priced = priced_cart()
+    lines = priced.lines
+    delivery_address, declared_value_rands, problem = _delivery_request(priced)
+    if problem:
+        session["cg_error"] = problem
+        return _back_to_checkout()
+
+    # rate-card mode: known zone/band cells price instantly; live call happens at payment
+    if rate_card.RATE_CARD_MODE and postcodes.index().zone_for_code(delivery_address["code"]):
+        cell = rate_card.lookup(delivery_address["zone"], priced.bottle_count, declared_value_rands)
+        if cell is not None:
+            session["delivery_fee_cents"] = cell["fee_cents"]
+            session["cg_quote"] = RateQuote("shiplogic", cell["service"], cell["fee_cents"], "", "")
+            session["cg_quote_source"] = "rate_card"
+            session["cg_quote_fp"] = _quote_fingerprint(priced, "rate_card")
+            session["delivery_method"] = "courier_guy"
+            return _back_to_checkout()
 
-        session["delivery_fee_cents"] = best["fee_cents"]
-        session["cg_quote_raw"] = best["raw"]
-        session["cg_rates"] = normalized
+    try:
+        # every configured carrier is asked at once; total wait is capped by QUOTE_DEADLINE
+        rates, errors = quote_all(delivery_address, lines, declared_value_rands)
+        if errors:
+            app.logger.warning("courier quote errors: %s", errors)
+        if not rates:
+            if errors:
+                session["cg_error"] = QUOTE_UNAVAILABLE
+            else:
+                session["cg_error"] = "No rates returned. Check the delivery address."
+            return _back_to_checkout()
+
+        best = rates[0]
+
+        session["delivery_fee_cents"] = best.fee_cents
+        session["cg_quote"] = best
+        # a carrier that errored only contributes its last-known-good rates
+        session["cg_estimate"] = best.carrier in errors
+        session["cg_quote_source"] = "live"
+        session["cg_quote_fp"] = _quote_fingerprint(priced, "live")
+        session["cg_rates"] = rates
         session["delivery_method"] = "courier_guy"
         session["cg_error"] = ""
 
-    except Exception as e:
-        session["cg_error"] = str(e)
+    except Exception:
+        app.logger.exception("courier quote failed")
+        session["cg_error"] = QUOTE_UNAVAILABLE
+
+    return _back_to_checkout()
+
+@app.before_request
+def _admit_upstream_routes():
+    """
+    Rate limits and upstream concurrency caps (services/admission.py) for
+    the routes that call Shiplogic or Yoco. Runs before the other hooks on
+    those routes, which make upstream calls of their own.
+    """
+    rejection = admission.admit(request.endpoint)
+    if rejection is None:
+        return None
+    if rejection.reason == "rate":
+        session["cg_error"] = TOO_FAST.format(seconds=rejection.retry_after)
+    else:
+        session["cg_error"] = TOO_BUSY.get(request.endpoint, QUOTE_UNAVAILABLE)
+    if _wants_json():
+        state, status = _checkout_state(429)
+        return state, status, {"Retry-After": str(rejection.retry_after)}
+    return redirect(url_for("checkout"))
 
+@app.teardown_request
+def _release_upstream_slot(exc):
+    admission.release()
+
+@app.before_request
+def _require_courier_quote():
+    """
+    Courier delivery is only paid for with a quote in hand; yoco_start
+    charges whatever delivery_fee_cents holds, 0 included.
+    """
+    if request.endpoint != "yoco_start" or session.get("delivery_method") != "courier_guy":
+        return None
+    if session.get("cg_quote") and int(session.get("delivery_fee_cents", 0) or 0) > 0:
+        return None
+    session["cg_error"] = QUOTE_MISSING
     return redirect(url_for("checkout"))
 
+@app.before_request
+def _confirm_courier_price():
+    """
+    Rate-card prices and last-known-good estimates are confirmed live just
+    before payment. If the live price differs, the fee is updated and the
+    shopper is sent back to checkout to see it. A card price stands when the
+    carrier can't be reached; an estimate doesn't (it may be days old and for
+    another parcel in the band), so payment waits. yoco_start itself is
+    locked, so this runs as a hook.
+    """
+    if request.endpoint != "yoco_start" or session.get("delivery_method") != "courier_guy":
+        return None
+    estimate = bool(session.get("cg_estimate"))
+    if session.get("cg_quote_source") != "rate_card" and not estimate:
+        return None
+
+    def unconfirmed():
+        if not estimate:
+            return None
+        session["cg_error"] = QUOTE_UNAVAILABLE
+        return redirect(url_for("checkout"))
+
+    priced = priced_cart()
+    delivery_address, declared_value_rands, problem = _delivery_request(priced)
+    if problem:
+        return unconfirmed()
+    try:
+        rates, errors = quote_all(delivery_address, priced.lines, declared_value_rands)
+    except Exception:
+        app.logger.exception("live price check before payment failed")
+        return unconfirmed()
+    live = [q for q in rates if q.carrier not in errors]
+    if not live:
+        return unconfirmed()
+
+    best = live[0]
+    session["cg_quote_source"] = "live"
+    session["cg_quote_fp"] = _quote_fingerprint(priced, "live")
+    session["cg_quote"] = best
+    session["cg_estimate"] = False
+    session["cg_rates"] = live
+    if best.fee_cents != int(session.get("delivery_fee_cents", 0) or 0):
+        session["delivery_fee_cents"] = best.fee_cents
+        session["cg_error"] = f"Delivery price updated to {cents_to_zar(best.fee_cents)}. Please check your total and pay again."
+        return redirect(url_for("checkout"))
+    return None
+
+@app.before_request
+def _dedupe_yoco_start():
+    """
+    Repeats of the same payment (double click, back button) get the Yoco
+    checkout the first attempt created instead of starting another one.
+    The first attempt also reserves the cart's stock.
+    """
+    if request.endpoint in ("payment_success", "payment_cancel", "payment_failed"):
+        if session.get("pay_token"):
+            pay_dedup.forget(session["pay_token"])
+        return None
+    if request.endpoint != "yoco_start" or not YOCO_SECRET_KEY:
+        return None
+
+    if "pay_token" not in session:
+        session["pay_token"] = uuid.uuid4().hex
+    priced = priced_cart()
+    if not priced.lines:
+        return None
+    delivery_method = session.get("delivery_method", "pickup")
+    fp = pay_dedup.fingerprint(
+        session["pay_token"],
+        session.get("cart", {}),
+        priced.subtotal_cents,
+        delivery_method,
+        int(session.get("delivery_fee_cents", 0) or 0) if delivery_method == "courier_guy" else 0,
+    )
+
+    state, url = pay_dedup.claim(fp, session["pay_token"])
+    if state == "start":
+        # a new cart replaces this session's earlier checkout: its hold and replays go
+        if session.get("order_id"):
+            inventory.release(session["order_id"])
+        pay_dedup.forget(session["pay_token"], keep=fp)
+        # hold the stock before Yoco is asked; it's renamed to the order id afterwards
+        hold_id = "hold-" + uuid.uuid4().hex
+        short = inventory.reserve(hold_id, session.get("cart", {}))
+        if short:
+            pay_dedup.release(fp)
+            snap = catalog.current()
+            session["cg_error"] = "Not enough stock: " + ", ".join(
+                f"only {n} left of {snap.by_id[pid]['name'] if pid in snap.by_id else pid}" for pid, n in short.items()
+            ) + ". Please clear your cart and add fewer."
+            return redirect(url_for("checkout"))
+        g.pay_dedup_fp = fp
+        g.stock_hold = hold_id
+        metrics.inc("pay_dedup_total", outcome="started")
+        return None
+    if state == "busy":
+        url = pay_dedup.wait_for(fp)
+        if not url:
+            metrics.inc("pay_dedup_total", outcome="gave_up")
+            session["cg_error"] = "Your payment is still being set up. Please wait a moment and try again."
+            return redirect(url_for("checkout"))
+        metrics.inc("pay_dedup_total", outcome="waited")
+    else:
+        metrics.inc("pay_dedup_total", outcome="replayed")
+    return redirect(url)
+
+def _order_snapshot() -> dict:
+    """
+    Amounts, customer and items of the session's current order.
+    """
+    priced = priced_cart()
+    delivery_method = session.get("delivery_method", "pickup")
+    # same fee rules as yoco_start
+    if delivery_method == "flat":
+        delivery = 8000
+    elif delivery_method == "courier_guy":
+        delivery = int(session.get("delivery_fee_cents", 0) or 0)
+    else:
+        delivery = 0
+    return dict(
+        amount_cents=priced.subtotal_cents + delivery,
+        subtotal_cents=priced.subtotal_cents,
+        delivery_cents=delivery,
+        delivery_method=delivery_method,
+        customer_name=session.get("customer_name", ""),
+        customer_phone=session.get("customer_phone", ""),
+        customer_email=session.get("customer_email", ""),
+        items=[[l.id, l.qty, l.unit_cents] for l in priced.lines],
+    )
+
+def _journal_order(event: str, **detail):
+    """
+    Queues an order journal event for the session's current order.
+    """
+    orders.record(event, session.get("order_id", ""), **_order_snapshot(), detail=detail or None)
+
+@app.after_request
+def _record_yoco_start(response):
+    fp = g.pop("pay_dedup_fp", None)
+    if fp:
+        hold_id = g.pop("stock_hold", None)
+        location = response.location or ""
+        to_yoco = location.startswith(("http://", "https://")) and not location.startswith(request.host_url)
+        if response.status_code in (301, 302, 303, 307, 308) and to_yoco:
+            pay_dedup.complete(fp, location)
+            inventory.rename(hold_id, session.get("order_id", ""))
+            _journal_order("checkout_started", redirect_url=location)
+        else:
+            pay_dedup.release(fp)
+            inventory.release(hold_id)
+            _journal_order("checkout_failed", error=(session.get("cg_error") or "")[:500])
+    return response
+
+@app.teardown_request
+def _release_yoco_start(exc):
+    # after_request doesn't run when the view raised
+    fp = g.pop("pay_dedup_fp", None)
+    if fp:
+        pay_dedup.release(fp)
+        inventory.release(g.pop("stock_hold", ""))
+
+@app.route("/api/postcodes")
+def api_postcodes():
+    q = request.args.get("q", "")
+    try:
+        limit = max(1, min(25, int(request.args.get("limit", "10"))))
+    except ValueError:
+        limit = 10
+    results = []
+    for place in postcodes.index().search(q, limit=limit):
+        row = place.as_dict()
+        row["province"] = PROVINCE_BY_ZONE.get(place.zone, "")
+        results.append(row)
+    return {"results": results}
+
 # -----------------------
 # YOCO: Start payment (DO NOT CHANGE)
 # -----------------------
@@ -382,22 +758,124 @@ def yoco_start():
 
 @app.route("/payment/success")
 def payment_success():
+    # display only: anyone can open this URL, so stock and "paid" come from the webhook
+    orders.record("returned_success", session.get("order_id", ""))
     return "Payment successful ✅"
 
 @app.route("/payment/cancel")
 def payment_cancel():
+    orders.record("cancelled", session.get("order_id", ""))
+    inventory.release(session.get("order_id", ""))
     return "Payment cancelled"
 
 @app.route("/payment/failed")
 def payment_failed():
+    orders.record("failed", session.get("order_id", ""))
+    inventory.release(session.get("order_id", ""))
     return "Payment failed"
 
+@app.route("/payment/webhook", methods=["POST"])
+def payment_webhook():
+    """
+    Yoco's signed payment events (services/yoco_webhook.py), the only proof
+    that an order was paid. Yoco retries until it gets a 2xx, so handling
+    one event twice must be harmless.
+    """
+    body = request.get_data()
+    if not yoco_webhook.verify(settings.current().yoco_webhook_secret, request.headers, body):
+        abort(403)
+    event = request.get_json(silent=True) or {}
+    if event.get("type") != "payment.succeeded":
+        return {"ok": True}
+    payment = event.get("payload") or {}
+    order_id = str((payment.get("metadata") or {}).get("order_id") or "")
+    if not order_id:
+        app.logger.warning("Yoco payment %s has no order_id", payment.get("id"))
+        return {"ok": True}
+    _order_paid(order_id, payment)
+    return {"ok": True}
+
+def _order_paid(order_id: str, payment: dict):
+    """
+    A payment Yoco confirmed: the held stock is sold, and the journal and
+    the order notification (services/notify.py) get "paid" with what was
+    ordered when checkout started (the shopper's cart may have changed since).
+    """
+    inventory.commit(order_id)
+    snapshot = orders.checkout_snapshot(order_id) or {}
+    amount = payment.get("amount")
+    if snapshot and amount is not None and int(amount) != snapshot["amount_cents"]:
+        app.logger.warning("order %s paid %s cents, checkout was for %s", order_id, amount, snapshot["amount_cents"])
+    # keyed by order, so a retried webhook stops here; if the queue is down the 500 makes Yoco retry
+    queued = tasks.enqueue(
+        "order_webhook", {"event": "paid", "order_id": order_id, **snapshot, "payment_id": payment.get("id")}, key=f"paid:{order_id}"
+    )
+    if queued:
+        orders.record("paid", order_id, **snapshot, detail={"payment_id": payment.get("id"), "amount_cents": amount})
+
+def _require_admin():
+    """
+    403 unless the request carries ADMIN_KEY as ?key= or a Bearer token.
+    """
+    key = request.args.get("key", "") or request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(key.encode("utf-8"), ADMIN_KEY.encode("utf-8")):
+        abort(403)
+
 @app.route("/admin")
 def admin():
-    key = request.args.get("key", "")
-    if key != ADMIN_KEY:
-        abort(403)
-    return {"ok": True, "products": PRODUCTS}
+    _require_admin()
+    snap = catalog.current()
+    return {"ok": True, "products": [dict(p) for p in snap.products], "catalog_version": snap.version, "rate_cache": quote_cache.stats(), "stock": inventory.available(), "tasks": tasks.stats()}
+
+@app.route("/admin/metrics")
+def admin_metrics():
+    _require_admin()
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/admin/orders")
+def admin_orders():
+    """
+    Streams the order journal oldest first, as NDJSON (default) or CSV
+    (?format=csv). Page with ?after=<last seq seen>&limit=N.
+    """
+    _require_admin()
+    fmt = request.args.get("format", "ndjson").strip().lower()
+    try:
+        after = int(request.args.get("after", "0") or 0)
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+    except ValueError:
+        abort(400)
+    rows = orders.iter_events(after=after, limit=limit)
+
+    if fmt == "csv":
+        def generate():
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(orders.COLUMNS)
+            for row in rows:
+                writer.writerow([row[c] for c in orders.COLUMNS])
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            yield buf.getvalue()
+        return Response(generate(), mimetype="text/csv",
+                        headers={"Content-Disposition": "attachment; filename=orders.csv"})
+    if fmt != "ndjson":
+        abort(400)
+    return Response((orders.to_ndjson(row) for row in rows), mimetype="application/x-ndjson")
+
+@app.route("/admin/profiles")
+def admin_profiles():
+    _require_admin()
+    return {"ok": True, "enabled": profiler.PROFILING, "profiles": profiler.list_profiles()}
+
+@app.route("/admin/profiles/<name>")
+def admin_profile(name):
+    _require_admin()
+    if not profiler.NAME_RE.match(name):
+        abort(404)
+    return send_from_directory(profiler.PROFILE_DIR, name, mimetype="text/plain", as_attachment=True)
 
 if __name__ == "__main__":
+    settings.install_sighup()
     app.run(debug=True)
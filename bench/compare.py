@@ -0,0 +1,40 @@
+"""
+Compare two bench reports route by route.
+
+    python -m bench.compare bench/results/old.json bench/results/new.json
+"""
+import json
+import sys
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _delta(old: float, new: float) -> str:
+    if not old:
+        return "   n/a"
+    return f"{(new - old) / old * 100:+6.1f}%"
+
+def main():
+    if len(sys.argv) != 3:
+        print(__doc__.strip())
+        sys.exit(2)
+    old, new = _load(sys.argv[1]), _load(sys.argv[2])
+    print(f"{old['commit']} -> {new['commit']}")
+
+    old_levels = {l["concurrency"]: l for l in old["levels"]}
+    for level in new["levels"]:
+        c = level["concurrency"]
+        before = old_levels.get(c)
+        if before is None:
+            continue
+        print(f"c={c}: rps {before['rps']} -> {level['rps']} ({_delta(before['rps'], level['rps'])})")
+        for route, r in level["routes"].items():
+            b = before["routes"].get(route)
+            if not b:
+                continue
+            print(f"    {route:<26} p95 {b['p95_ms']:>8} -> {r['p95_ms']:>8}ms ({_delta(b['p95_ms'], r['p95_ms'])})"
+                  f"  p99 {b['p99_ms']:>8} -> {r['p99_ms']:>8}ms ({_delta(b['p99_ms'], r['p99_ms'])})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Load test: scripted shopper flows against gunicorn, with local Shiplogic/Yoco stubs.
+
+    python -m bench.run --levels 1,4,16 --duration 20 --workers 2
+    python -m bench.run --app-url http://127.0.0.1:8000   # app already running
+
+Each virtual shopper loops: GET / -> add to cart -> checkout -> save details ->
+courier quote -> checkout -> start Yoco payment. Redirects are not followed, so
+every sample is one round trip. A JSON report (rps and p50/p95/p99 per route
+per concurrency level) is written under bench/results/; compare two with
+`python -m bench.compare old.json new.json`.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from bench import stubs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRODUCT_IDS = ["gin", "vodka", "whitewine", "redwine"]
+
+# (suburb, city, postal code, province label) - varied enough to exercise the quote cache
+ADDRESSES = [
+    ("Hatfield", "Pretoria", "0083", "Gauteng (GP)"),
+    ("Sandton", "Johannesburg", "2196", "Gauteng (GP)"),
+    ("Sea Point", "Cape Town", "8005", "Western Cape (WC)"),
+    ("Umhlanga", "Durban", "4319", "KwaZulu-Natal (KZN)"),
+    ("Summerstrand", "Gqeberha", "6001", "Eastern Cape (EC)"),
+    ("Westdene", "Bloemfontein", "9301", "Free State (FS)"),
+    ("Bendor", "Polokwane", "0699", "Limpopo (LP)"),
+    ("Sonheuwel", "Mbombela", "1201", "Mpumalanga (MP)"),
+    ("Cashan", "Rustenburg", "0299", "North West (NW)"),
+    ("Belgravia", "Kimberley", "8301", "Northern Cape (NC)"),
+]
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # route -> [seconds]
+        self.errors = {}   # route -> count
+
+    def add(self, route: str, seconds: float, ok: bool):
+        with self.lock:
+            self.samples.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        routes = {}
+        total = 0
+        errors = 0
+        for route, values in sorted(self.samples.items()):
+            values = sorted(values)
+            total += len(values)
+            errors += self.errors.get(route, 0)
+            routes[route] = {
+                "count": len(values),
+                "errors": self.errors.get(route, 0),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+            }
+        return {
+            "requests": total,
+            "errors": errors,
+            "rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "routes": routes,
+        }
+
+def shopper(base: str, rec: Recorder, stop_at: float, address_pool: list):
+    s = requests.Session()
+
+    def step(route: str, method: str, path: str, ok=None, **kw):
+        start = time.perf_counter()
+        try:
+            r = s.request(method, base + path, allow_redirects=False, timeout=60, **kw)
+            good = r.status_code < 400 and (ok is None or ok(r))
+        except requests.RequestException:
+            good = False
+        rec.add(route, time.perf_counter() - start, good)
+
+    while time.time() < stop_at:
+        suburb, city, code, province = random.choice(address_pool)
+        step("GET /", "GET", "/")
+        step("POST /cart/add", "POST", "/cart/add", data={"product_id": random.choice(PRODUCT_IDS), "qty": random.randint(1, 6)})
+        step("GET /checkout", "GET", "/checkout")
+        step("POST /checkout/details", "POST", "/checkout/details", data={
+            "delivery_method": "courier_guy", "customer_name": "Bench", "customer_phone": "0820000000",
+            "customer_email": "bench@example.com", "cg_street": "1 Test Street", "cg_suburb": suburb,
+            "cg_city": city, "cg_postal": code, "cg_province": province,
+        })
+        step("POST /courier/quote", "POST", "/courier/quote")
+        step("GET /checkout", "GET", "/checkout")
+        # the app redirects back to /checkout when Yoco fails
+        step("POST /pay/yoco/start", "POST", "/pay/yoco/start",
+             ok=lambda r: "/checkout" not in r.headers.get("Location", "/checkout"))
+        s.post(base + "/cart/clear", allow_redirects=False, timeout=60)
+
+def run_level(base: str, concurrency: int, duration: float, address_pool: list) -> dict:
+    rec = Recorder()
+    stop_at = time.time() + duration
+    threads = [
+        threading.Thread(target=shopper, args=(base, rec, stop_at, address_pool), daemon=True)
+        for _ in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    result = rec.summary(time.perf_counter() - start)
+    result["concurrency"] = concurrency
+    return result
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_app(args, stub_port: int, data_dir: str):
+    port = _free_port()
+    stub = f"http://127.0.0.1:{stub_port}"
+    env = dict(os.environ)
+    env.update({
+        "SHIPLOGIC_API_KEY": "bench",
+        "SHIPLOGIC_RATES_URL": f"{stub}/rates",
+        "UPSTREAM_BASE_YOCO": stub,
+        "YOCO_SECRET_KEY": "sk_bench",
+        "PUBLIC_URL": f"http://127.0.0.1:{port}",
+        "SL_FROM_STREET": "1 Bench Road",
+        "SL_FROM_CITY": "Colesberg",
+        "SL_FROM_CODE": "9795",
+        "SL_FROM_ZONE": "Northern Cape",
+        "DATA_DIR": data_dir,
+        # every virtual user shares one IP; admission control would measure itself
+        "RATE_LIMIT_COURIER_QUOTE": "1000000/1",
+        "RATE_LIMIT_YOCO_START": "1000000/1",
+        "UPSTREAM_CONCURRENCY_SHIPLOGIC": "0",
+        "UPSTREAM_CONCURRENCY_YOCO": "0",
+    })
+    env.pop("COURIERGUY_API_KEY", None)
+    cmd = [sys.executable, "-m", "gunicorn", "-b", f"127.0.0.1:{port}",
+           "-w", str(args.workers), "-k", args.worker_class, "--threads", str(args.threads),
+           "--log-level", "warning", "app:app"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(base + "/", timeout=1)
+            return proc, base
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not come up within 30s")
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--levels", default="1,4,16", help="comma-separated concurrency levels")
+    ap.add_argument("--duration", type=float, default=15.0, help="seconds per level")
+    ap.add_argument("--app-url", default="", help="target an already running app instead of starting gunicorn")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--worker-class", default="sync")
+    ap.add_argument("--threads", type=int, default=1)
+    ap.add_argument("--addresses", type=int, default=len(ADDRESSES), help="size of the address pool (1 = every quote hits the cache)")
+    ap.add_argument("--shiplogic-latency", type=float, default=0.4)
+    ap.add_argument("--shiplogic-jitter", type=float, default=0.1)
+    ap.add_argument("--shiplogic-errors", type=float, default=0.0)
+    ap.add_argument("--yoco-latency", type=float, default=0.3)
+    ap.add_argument("--yoco-jitter", type=float, default=0.05)
+    ap.add_argument("--yoco-errors", type=float, default=0.0)
+    ap.add_argument("--out", default="", help="report path (default bench/results/<time>-<commit>.json)")
+    args = ap.parse_args()
+
+    server = stubs.start(
+        shiplogic=stubs.StubConfig(args.shiplogic_latency, args.shiplogic_jitter, args.shiplogic_errors),
+        yoco=stubs.StubConfig(args.yoco_latency, args.yoco_jitter, args.yoco_errors),
+    )
+    proc = None
+    data_dir = tempfile.mkdtemp(prefix="firstpour-bench-")
+    try:
+        if args.app_url:
+            base = args.app_url.rstrip("/")
+        else:
+            proc, base = start_app(args, server.server_port, data_dir)
+
+        pool = ADDRESSES[:max(1, args.addresses)]
+        levels = []
+        for c in [int(x) for x in args.levels.split(",") if x.strip()]:
+            result = run_level(base, c, args.duration, pool)
+            levels.append(result)
+            print(f"c={c:<4} rps={result['rps']:<8} errors={result['errors']}")
+            for route, r in result["routes"].items():
+                print(f"    {route:<26} p50={r['p50_ms']:>8}ms p95={r['p95_ms']:>8}ms p99={r['p99_ms']:>8}ms")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        server.shutdown()
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "levels": levels,
+    }
+    out = args.out or os.path.join(ROOT, "bench", "results", f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"report: {out}")
+
+if __name__ == "__main__":
+    main()
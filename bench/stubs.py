@@ -0,0 +1,111 @@
+"""
+Local stand-ins for api.shiplogic.com/rates and payments.yoco.com/api/checkouts,
+with configurable latency and error injection.
+
+    python -m bench.stubs --port 9101 --latency 0.4 --jitter 0.1 --error-rate 0.05
+
+One server answers both APIs (and the PUDO /rates shape, which is the same).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubConfig:
+    def __init__(self, latency=0.3, jitter=0.1, error_rate=0.0, hang_rate=0.0, hang_seconds=30.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+
+def _rates_body(payload: dict) -> dict:
+    parcels = payload.get("parcels") or [{}]
+    weight = float(parcels[0].get("submitted_weight_kg", 1.5) or 1.5)
+    base = 85.0 + 12.5 * weight
+    return {
+        "rates": [
+            {"rate": round(base, 2), "rate_excluding_vat": round(base / 1.15, 2),
+             "service_level": {"id": 1, "code": "ECO", "name": "Economy",
+                               "delivery_date_from": "2026-01-02", "delivery_date_to": "2026-01-05"}},
+            {"rate": round(base * 1.6, 2), "rate_excluding_vat": round(base * 1.6 / 1.15, 2),
+             "service_level": {"id": 2, "code": "ONX", "name": "Overnight Express",
+                               "delivery_date_from": "2026-01-02", "delivery_date_to": "2026-01-02"}},
+        ]
+    }
+
+def make_handler(configs: dict):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, body: dict):
+            blob = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(blob)))
+            self.end_headers()
+            self.wfile.write(blob)
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            try:
+                payload = json.loads(raw or b"{}")
+            except ValueError:
+                payload = {}
+
+            path = self.path.split("?")[0]
+            if path.endswith("/rates"):
+                cfg, body = configs["shiplogic"], lambda: _rates_body(payload)
+            elif path.endswith("/api/checkouts"):
+                cid = "ch_" + uuid.uuid4().hex[:16]
+                host = self.headers.get("Host", "127.0.0.1")
+                cfg, body = configs["yoco"], lambda: {"id": cid, "status": "created", "redirectUrl": f"http://{host}/pay/{cid}"}
+            else:
+                return self._send(404, {"error": "not found"})
+
+            roll = random.random()
+            if roll < cfg.hang_rate:
+                time.sleep(cfg.hang_seconds)
+            time.sleep(max(0.0, random.gauss(cfg.latency, cfg.jitter)))
+            if random.random() < cfg.error_rate:
+                return self._send(503, {"error": "injected failure"})
+            self._send(200, body())
+
+    return Handler
+
+def start(port: int = 0, shiplogic: StubConfig = None, yoco: StubConfig = None) -> ThreadingHTTPServer:
+    """
+    Starts the stub server on a background thread; returns it (use .server_port).
+    """
+    configs = {"shiplogic": shiplogic or StubConfig(), "yoco": yoco or StubConfig()}
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(configs))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="bench-stubs", daemon=True).start()
+    return server
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=9101)
+    ap.add_argument("--latency", type=float, default=0.3)
+    ap.add_argument("--jitter", type=float, default=0.1)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--hang-rate", type=float, default=0.0)
+    args = ap.parse_args()
+
+    cfg = StubConfig(args.latency, args.jitter, args.error_rate, args.hang_rate)
+    server = start(args.port, cfg, cfg)
+    print(f"stubs listening on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
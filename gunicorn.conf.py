@@ -0,0 +1,68 @@
+"""
+Gunicorn settings (loaded automatically from the working directory).
+
+Workers are threaded (gthread) so a request waiting on Shiplogic, PUDO or
+Yoco only holds its own thread; the other threads keep serving pages. Sizing:
+
+    workers = 2 x CPUs + 1, capped by WEB_MAX_WORKERS (memory: each is a copy of the app)
+    threads = 1 + UPSTREAM_LATENCY / REQUEST_CPU_TIME, clamped to 4..32
+
+i.e. enough threads that the CPU still has work while the rest wait on the
+network. Every knob can be pinned with an env var; -w/-k/--threads on the
+command line win over this file.
+"""
+import math
+import multiprocessing
+import os
+
+def _env_int(name: str, default: int) -> int:
+    v = os.getenv(name, "").strip()
+    return int(v) if v else default
+
+def _env_float(name: str, default: float) -> float:
+    v = os.getenv(name, "").strip()
+    return float(v) if v else default
+
+CPUS = multiprocessing.cpu_count()
+# Expected wall time of a slow request's upstream call (the quote deadline, by default).
+UPSTREAM_LATENCY = _env_float("UPSTREAM_LATENCY", _env_float("QUOTE_DEADLINE", 2.5))
+# CPU a request needs in Python (templating, session, JSON).
+REQUEST_CPU_TIME = _env_float("REQUEST_CPU_TIME", 0.02)
+WEB_MAX_WORKERS = _env_int("WEB_MAX_WORKERS", 4)
+
+def default_workers() -> int:
+    return max(1, min(2 * CPUS + 1, WEB_MAX_WORKERS))
+
+def default_threads() -> int:
+    return max(4, min(32, 1 + math.ceil(UPSTREAM_LATENCY / REQUEST_CPU_TIME)))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = _env_int("WEB_CONCURRENCY", default_workers())
+threads = _env_int("GUNICORN_THREADS", default_threads())
+
+# gevent is supported too (GUNICORN_WORKER_CLASS=gevent) if it is installed;
+# otherwise threads, which need nothing beyond the standard library.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread").strip() or "gthread"
+if worker_class == "gevent":
+    try:
+        import gevent  # noqa: F401
+        worker_connections = _env_int("GUNICORN_WORKER_CONNECTIONS", 200)
+    except ImportError:
+        worker_class = "gthread"
+
+# Longest legitimate request: Yoco's read timeout plus a retry, with margin.
+timeout = _env_int("GUNICORN_TIMEOUT", 60)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+keepalive = _env_int("GUNICORN_KEEPALIVE", 5)
+
+# One pooled upstream connection per thread, so threads never queue for a socket.
+os.environ.setdefault("HTTP_POOL_SIZE", str(max(threads, 10)))
+
+# Validate settings in the master before any worker forks, so a bad deploy
+# fails once, loudly, at boot. Workers inherit the .env values it loaded.
+from services import settings  # noqa: E402
+
+def on_reload(server):
+    # SIGHUP: re-read .env; a bad one is logged and the old settings are kept,
+    # so the replacement workers boot with what was running.
+    settings.reload()
@@ -0,0 +1,155 @@
+"""
+Admission control for routes that call a paid or slow upstream.
+
+Two checks, both kept in SQLite so every gunicorn worker sees the same state:
+
+- a token bucket per route and client, keyed by IP and by session, so one
+  visitor (or one bot rotating cookies from one address) can't run up the
+  Shiplogic quota. RATE_LIMIT_<ENDPOINT>="count/seconds" sets a route's limit;
+  the bucket holds `count` and refills evenly over `seconds`. Behind a
+  proxy, set TRUSTED_PROXIES so the address is the client's, not the proxy's.
+- a cap on requests in flight per upstream (UPSTREAM_CONCURRENCY_<NAME>).
+  Past it, requests are turned away at once rather than queueing behind the
+  slow ones and tying up every worker thread. A slot is a row with a lease,
+  so one left by a killed worker frees itself. 0 turns the cap off.
+
+admit() says yes or no; the caller decides how to answer. If the database
+can't be reached the request is let through: better an unmetered quote than
+no checkout.
+"""
+import logging
+import math
+import os
+import random
+import sqlite3
+import time
+import uuid
+from typing import NamedTuple
+
+from flask import g, request, session
+
+from services import db, metrics
+
+log = logging.getLogger(__name__)
+
+ADMISSION_DB = os.getenv("ADMISSION_DB", "").strip() or db.data_path("admission.sqlite3")
+# Proxies in front of the app that append to X-Forwarded-For. 0 (the
+# default) ignores the header, since a client talking to the app directly
+# could write anything there and get a fresh bucket per request. Set it to
+# the real number of hops in the deployment: TRUSTED_PROXIES=1 on Render.
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "0"))
+# A slot held longer than this is assumed abandoned (worker killed mid-request).
+SLOT_LEASE = float(os.getenv("ADMISSION_SLOT_LEASE", "60"))
+
+class Limit(NamedTuple):
+    count: int
+    per: float
+    upstream: str
+
+class Rejection(NamedTuple):
+    reason: str  # "rate" or "busy"
+    retry_after: int
+
+def _rate(endpoint: str, default: str):
+    raw = (os.getenv(f"RATE_LIMIT_{endpoint.upper()}") or default).strip()
+    count, _, per = raw.partition("/")
+    return int(count), float(per or 60)
+
+LIMITS = {
+    "courier_quote": Limit(*_rate("courier_quote", "10/60"), "shiplogic"),
+    "yoco_start": Limit(*_rate("yoco_start", "5/60"), "yoco"),
+}
+
+UPSTREAM_CONCURRENCY = {
+    name: int(os.getenv(f"UPSTREAM_CONCURRENCY_{name.upper()}", "16"))
+    for name in {limit.upstream for limit in LIMITS.values()}
+}
+
+metrics.register("admission_rejected_total", "counter", "Requests turned away, by route and reason (rate, busy).")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS slots (id TEXT PRIMARY KEY, upstream TEXT NOT NULL, expires REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS slots_upstream ON slots (upstream, expires)",
+)
+
+def _conn():
+    return db.connect(ADMISSION_DB, SCHEMA)
+
+def client_ip() -> str:
+    # each trusted proxy appends the address it saw; entries left of those are client-supplied
+    hops = [h.strip() for h in request.headers.get("X-Forwarded-For", "").split(",") if h.strip()]
+    if TRUSTED_PROXIES and len(hops) >= TRUSTED_PROXIES:
+        return hops[-TRUSTED_PROXIES]
+    return request.remote_addr or ""
+
+def _client_keys(endpoint: str) -> list:
+    keys = [f"{endpoint}:ip:{client_ip()}"]
+    sid = getattr(session, "sid", "")
+    if sid:
+        keys.append(f"{endpoint}:sid:{sid}")
+    return keys
+
+def _check(conn, keys: list, limit: Limit, now: float):
+    """
+    Returns (rejection or None, new bucket rows) inside the caller's transaction.
+    """
+    refill = limit.count / limit.per
+    rows = []
+    wait = 0.0
+    for key in keys:
+        found = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        tokens = limit.count if found is None else min(limit.count, found[0] + (now - found[1]) * refill)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) / refill)
+        rows.append((key, tokens - 1, now))
+    if wait:
+        return Rejection("rate", math.ceil(wait)), []
+    return None, rows
+
+def admit(endpoint: str):
+    """
+    Admits a request to `endpoint` (taking a token and an upstream slot) or
+    returns a Rejection. Routes without a limit are always admitted.
+    """
+    limit = LIMITS.get(endpoint)
+    if limit is None:
+        return None
+    now = time.time()
+    cap = UPSTREAM_CONCURRENCY.get(limit.upstream, 0)
+    slot = uuid.uuid4().hex
+    try:
+        with db.transaction(_conn()) as conn:
+            rejection, rows = _check(conn, _client_keys(endpoint), limit, now)
+            if rejection is None and cap > 0:
+                conn.execute("DELETE FROM slots WHERE upstream = ? AND expires <= ?", (limit.upstream, now))
+                (in_flight,) = conn.execute("SELECT COUNT(*) FROM slots WHERE upstream = ?", (limit.upstream,)).fetchone()
+                if in_flight >= cap:
+                    rejection = Rejection("busy", 2)
+                else:
+                    conn.execute("INSERT INTO slots (id, upstream, expires) VALUES (?, ?, ?)", (slot, limit.upstream, now + SLOT_LEASE))
+                    g.admission_slot = slot
+            if rejection is None:
+                conn.executemany("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", rows)
+            if random.random() < 0.01:
+                # a bucket idle for longer than its refill time is full again; no need to keep it
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - max(l.per for l in LIMITS.values()),))
+    except sqlite3.Error:
+        log.exception("admission check failed; letting %s through", endpoint)
+        g.pop("admission_slot", None)
+        return None
+    if rejection is not None:
+        metrics.inc("admission_rejected_total", route=endpoint, reason=rejection.reason)
+    return rejection
+
+def release():
+    """
+    Frees the request's upstream slot, if it took one. Call on teardown.
+    """
+    slot = g.pop("admission_slot", None)
+    if slot is None:
+        return
+    try:
+        _conn().execute("DELETE FROM slots WHERE id = ?", (slot,))
+    except sqlite3.Error:
+        log.exception("could not free admission slot (its lease will expire)")
@@ -0,0 +1,15 @@
+"""
+Carrier adapters, one module per carrier. Each exposes:
+
+    NAME                                             registry key
+    enabled() -> bool                                credentials present
+    parse(data) -> [RateQuote]                       upstream JSON, one pass
+    fetch(delivery_address, lines, declared_value)   live quotes -> [RateQuote]
+    estimate(...)                                    optional: stale quotes or None
+
+Adding a carrier is a new module here plus a line in CARRIERS.
+"""
+from services.carriers import courier_guy, shiplogic
+from services.carriers.base import RateQuote, from_session, rands_to_cents
+
+CARRIERS = {m.NAME: m for m in (shiplogic, courier_guy)}
@@ -0,0 +1,82 @@
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
+
+class RateQuote(NamedTuple):
+    """
+    One priced service from one carrier. This is all that's kept of an
+    upstream answer: quotes, sessions, the rate caches and the rate card
+    never hold raw JSON.
+    """
+    carrier: str
+    service: str
+    fee_cents: int
+    eta: str  # latest expected delivery date (YYYY-MM-DD), or ""
+    ref: str  # carrier's code for the service, or ""
+
+def rands_to_cents(value):
+    """
+    Exact rands -> cents (Decimal, so 99.95 is 9995, not 9994). None if the
+    value isn't a number.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        cents = (Decimal(str(value)) * 100).quantize(Decimal(1))
+    except (InvalidOperation, ValueError):
+        return None
+    return int(cents) if cents >= 0 else None
+
+def from_session(value):
+    """
+    RateQuote from the list/tuple a session stored it as, or None.
+    """
+    if not value:
+        return None
+    try:
+        return RateQuote._make(value)
+    except TypeError:
+        return None
+
+# Where Shiplogic-shaped APIs put the rate list and the price. "rates" and
+# "rate" are the documented ones; the rest are older / PUDO account variants.
+LIST_KEYS = ("rates", "service_levels", "results", "data")
+PRICE_KEYS = ("rate", "total", "total_price", "price", "amount")
+
+def rate_items(data, keys=LIST_KEYS) -> list:
+    """
+    The list of rate objects in an upstream answer, or [].
+    """
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        for k in keys:
+            v = data.get(k)
+            if isinstance(v, list):
+                return v
+    return []
+
+def parse_rates(carrier: str, data, default_service: str) -> list:
+    """
+    RateQuotes from a Shiplogic-shaped answer: a list of rate objects, each
+    with a price in rands and a "service_level" object (or plain name).
+    Items without a usable price are skipped.
+    """
+    quotes = []
+    for item in rate_items(data):
+        if not isinstance(item, dict):
+            continue
+        fee_cents = next((c for c in (rands_to_cents(item.get(k)) for k in PRICE_KEYS) if c is not None), None)
+        if fee_cents is None:
+            continue
+        level = item.get("service_level") or {}
+        if not isinstance(level, dict):
+            level = {"name": str(level)}
+        quotes.append(RateQuote(
+            carrier,
+            str(level.get("name") or item.get("service_level_name") or item.get("name") or item.get("courier")
+                or level.get("code") or default_service),
+            fee_cents,
+            str(level.get("delivery_date_to") or level.get("delivery_date_from") or ""),
+            str(level.get("code") or item.get("service_level_code") or ""),
+        ))
+    return quotes
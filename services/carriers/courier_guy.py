@@ -0,0 +1,21 @@
+"""
+Courier Guy / PUDO (api-pudo.co.za/rates). Same shape as Shiplogic, but
+older accounts answer under "data" or "results" and name the price "total"
+or "price". All of them are rands.
+"""
+import courier_guy
+from services import settings
+from services.carriers.base import parse_rates
+
+NAME = "courier_guy"
+
+def enabled() -> bool:
+    return bool(settings.current().courier_guy_api_key)
+
+def parse(data) -> list:
+    return parse_rates(NAME, data, "Courier Guy")
+
+def fetch(delivery_address: dict, lines: list, declared_value: int) -> list:
+    address = dict(delivery_address)
+    address.pop("_total_qty", None)
+    return parse(courier_guy.get_rates(address, lines, declared_value=declared_value))
@@ -0,0 +1,26 @@
+"""
+Shiplogic (api.shiplogic.com/rates). shiplogic_rates does the call, the
+parse and the caching; this adapter just hands its RateQuotes on.
+"""
+from services import shiplogic_rates
+
+NAME = "shiplogic"
+
+def enabled() -> bool:
+    return bool(shiplogic_rates.api_key())
+
+def parse(data) -> list:
+    return list(shiplogic_rates.parse(data))
+
+def fetch(delivery_address: dict, lines: list, declared_value: int) -> list:
+    # get_rates pops _total_qty, so it gets its own copy of the address
+    return list(shiplogic_rates.get_rates(delivery_address=dict(delivery_address), declared_value=declared_value))
+
+def estimate(delivery_address: dict, lines: list, declared_value: int):
+    """
+    Last-known-good rates for this zone and bottle band, or None.
+    """
+    quotes = shiplogic_rates.last_good_rates(delivery_address.get("zone"), delivery_address.get("_total_qty", 1))
+    if quotes is None:
+        return None
+    return list(quotes)
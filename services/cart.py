@@ -0,0 +1,75 @@
+from urllib.parse import quote
+
+from services.catalog import cents_to_zar
+
+class CartLine:
+    """
+    One priced cart line. Slotted to keep it small; also indexable like the
+    dicts it replaces (`line["qty"]`), which the locked Yoco route relies on.
+    """
+
+    __slots__ = ("id", "name", "qty", "unit_cents", "unit_display", "line_cents")
+
+    def __init__(self, pid: str, name: str, qty: int, unit_cents: int, unit_display: str):
+        self.id = pid
+        self.name = name
+        self.qty = qty
+        self.unit_cents = unit_cents
+        self.unit_display = unit_display
+        self.line_cents = unit_cents * qty
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+class Cart:
+    """
+    A session cart priced in one pass against a catalog snapshot: lines,
+    subtotal, item count and the bottle count used for parcel sizing.
+    """
+
+    __slots__ = ("lines", "subtotal_cents", "item_count")
+
+    def __init__(self, raw: dict, snapshot):
+        lines = []
+        subtotal = 0
+        count = 0
+        for pid, qty in (raw or {}).items():
+            p = snapshot.by_id.get(pid)
+            if not p:
+                continue
+            try:
+                q = int(qty)
+            except (TypeError, ValueError):
+                continue
+            if q <= 0:
+                continue
+            line = CartLine(pid, p["name"], q, p["price"], p["price_display"])
+            lines.append(line)
+            subtotal += line.line_cents
+            count += q
+        self.lines = tuple(lines)
+        self.subtotal_cents = subtotal
+        self.item_count = count
+
+    @property
+    def bottle_count(self) -> int:
+        # parcel sizing needs at least one bottle
+        return self.item_count or 1
+
+    def whatsapp_text(self, delivery_fee_cents: int) -> str:
+        parts = ["Hi First Pour. I want to order:%0A"]
+        for l in self.lines:
+            parts.append(f"- {quote(l.name)} x{l.qty}%0A")
+        total = self.subtotal_cents + delivery_fee_cents
+        parts.append(
+            f"%0ASubtotal: {quote(cents_to_zar(self.subtotal_cents))}"
+            f"%0ADelivery: {quote(cents_to_zar(delivery_fee_cents))}"
+            f"%0ATotal: {quote(cents_to_zar(total))}"
+        )
+        return "".join(parts)
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+
+log = logging.getLogger(__name__)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Products live in a data file so prices can change without a deploy.
+CATALOG_PATH = os.getenv("CATALOG_PATH", "").strip() or os.path.join(_ROOT, "data", "products.json")
+# How often (seconds) a request may stat the file to look for changes.
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "2"))
+
+def cents_to_zar(cents: int) -> str:
+    return f"R{cents/100:.2f}".replace(".00", "")
+
+class Snapshot:
+    """
+    One immutable load of the catalog: products in file order plus an id index.
+    `version` is a content hash, handy for cache keys.
+    """
+
+    __slots__ = ("products", "by_id", "version", "stamp")
+
+    def __init__(self, products, version: str, stamp):
+        self.products = tuple(products)
+        self.by_id = MappingProxyType({p["id"]: p for p in self.products})
+        self.version = version
+        self.stamp = stamp
+
+def _product(raw: dict):
+    pid = str(raw.get("id") or "").strip()
+    name = str(raw.get("name") or "").strip()
+    price = raw.get("price")
+    if not pid or not name or not isinstance(price, int) or price <= 0:
+        raise ValueError(f"Bad product entry: {raw!r} (need id, name and a positive integer price in cents)")
+    p = dict(raw)
+    p["id"] = pid
+    p["name"] = name
+    p["price_display"] = raw.get("price_display") or cents_to_zar(price)
+    return MappingProxyType(p)
+
+def load(path: str = None) -> Snapshot:
+    path = path or CATALOG_PATH
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        blob = f.read()
+    data = json.loads(blob.decode("utf-8-sig"))
+    rows = data.get("products") if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        raise ValueError(f"{path}: expected a list of products")
+
+    products = [_product(r) for r in rows]
+    ids = [p["id"] for p in products]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"{path}: duplicate product ids")
+
+    version = hashlib.sha1(blob).hexdigest()[:12]
+    return Snapshot(products, version, (st.st_mtime_ns, st.st_size))
+
+_current = None
+_checked_at = 0.0
+_bad_stamp = None  # last file state that failed to load, so we don't retry it every check
+_lock = threading.Lock()
+
+def current() -> Snapshot:
+    """
+    The live snapshot. Every CATALOG_CHECK_INTERVAL seconds one caller stats
+    the file and, if it changed, loads and swaps in a new snapshot; a file that
+    fails to parse keeps the previous one serving.
+    """
+    global _current, _checked_at, _bad_stamp
+    snap = _current
+    now = time.monotonic()
+    if snap is not None and now - _checked_at < CATALOG_CHECK_INTERVAL:
+        return snap
+
+    with _lock:
+        if _current is not None and now - _checked_at < CATALOG_CHECK_INTERVAL:
+            return _current
+        _checked_at = now
+        if _current is None:
+            _current = load()
+            return _current
+        stamp = None
+        try:
+            st = os.stat(CATALOG_PATH)
+            stamp = (st.st_mtime_ns, st.st_size)
+            if stamp != _current.stamp and stamp != _bad_stamp:
+                _current = load()
+        except Exception as e:
+            _bad_stamp = stamp
+            log.warning("catalog reload failed, keeping version %s: %s", _current.version, e)
+        return _current
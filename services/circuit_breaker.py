@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+from services import metrics
+
+CB_FAILURE_THRESHOLD = int(os.getenv("CB_FAILURE_THRESHOLD", "5"))
+CB_RECOVERY_TIMEOUT = float(os.getenv("CB_RECOVERY_TIMEOUT", "30"))
+CB_HALF_OPEN_MAX = int(os.getenv("CB_HALF_OPEN_MAX", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+metrics.register("circuit_transitions_total", "counter", "Circuit breaker state changes, by breaker and new state.")
+metrics.register("circuit_rejected_total", "counter", "Calls refused because the circuit was open.")
+
+class CircuitOpen(Exception):
+    pass
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker, per worker process.
+
+    closed:    calls go through; CB_FAILURE_THRESHOLD failures in a row open it.
+    open:      calls fail fast for CB_RECOVERY_TIMEOUT seconds.
+    half_open: up to CB_HALF_OPEN_MAX probe calls go through; one success
+               closes the circuit, one failure re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CB_FAILURE_THRESHOLD,
+                 recovery_timeout: float = CB_RECOVERY_TIMEOUT, half_open_max: int = CB_HALF_OPEN_MAX):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max = max(1, half_open_max)
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _move(self, state: str):
+        # caller holds self._lock
+        if state != self._state:
+            self._state = state
+            metrics.inc("circuit_transitions_total", breaker=self.name, state=state)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    metrics.inc("circuit_rejected_total", breaker=self.name)
+                    return False
+                self._move(HALF_OPEN)
+                self._probes = 0
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_max:
+                    metrics.inc("circuit_rejected_total", breaker=self.name)
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probes = 0
+            self._move(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probes = 0
+                self._move(OPEN)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Runs fn through the breaker. Raises CircuitOpen without calling fn
+        while the circuit is open.
+        """
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} is unavailable (circuit open)")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
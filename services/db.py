@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Where local state files (SQLite, JSON snapshots) live. On Render this is the
+# instance disk shared by every gunicorn worker on the box.
+DATA_DIR = (os.getenv("DATA_DIR") or "instance").strip()
+
+_local = threading.local()
+_schemas = set()  # (path, statements) already applied in this process
+_started = {}  # background thread name -> pid that started it
+_lock = threading.Lock()
+
+def data_path(name: str) -> str:
+    return os.path.join(DATA_DIR, name)
+
+def connect(path: str, schema: tuple = ()) -> sqlite3.Connection:
+    """
+    Returns this thread's connection to the SQLite file at `path`.
+
+    sqlite3 connections can't be shared between threads, so we keep one per
+    thread per file. Autocommit mode: callers that need atomic read-modify-write
+    wrap it in transaction(). WAL lets readers in other workers carry on
+    while one worker writes.
+
+    `schema` (CREATE ... IF NOT EXISTS statements) runs the first time each
+    process connects to the file.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+
+    conn = conns.get(path)
+    if conn is None:
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conns[path] = conn
+    if schema and (path, schema) not in _schemas:
+        for statement in schema:
+            conn.execute(statement)
+        _schemas.add((path, schema))
+    return conn
+
+@contextmanager
+def transaction(conn: sqlite3.Connection):
+    """
+    BEGIN IMMEDIATE ... COMMIT around the block, rolled back if it raises.
+    IMMEDIATE takes the write lock up front, so a read-modify-write inside
+    can't race another worker's.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def start_once(name: str, target, *args) -> bool:
+    """
+    Starts daemon thread `name` running target(*args) unless this process
+    already has; a forked gunicorn worker gets its own. Cheap enough to call
+    on every request. Returns True if it started one.
+    """
+    pid = os.getpid()
+    if _started.get(name) == pid:
+        return False
+    with _lock:
+        if _started.get(name) == pid:
+            return False
+        _started[name] = pid
+    threading.Thread(target=target, args=args, name=name, daemon=True).start()
+    return True
@@ -0,0 +1,170 @@
+"""
+HTTP delivery: fingerprinted static URLs, a rendered-page cache with ETags,
+and gzip/brotli compression.
+
+    url_for('static', filename='styles.css')  ->  /static/styles.css?v=<content hash>
+
+A request carrying the current ?v= is served with a one-year immutable
+Cache-Control, so browsers never ask again until the file (and so its URL)
+changes. Pages cached with cached_page() carry a weak ETag and answer a
+matching If-None-Match with an empty 304. Brotli is used when the client
+accepts it and the `brotli` package is installed, gzip otherwise.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from services import metrics
+
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", str(365 * 24 * 3600)))
+# Responses smaller than this aren't worth compressing.
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "512"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "32"))
+
+COMPRESSIBLE = ("text/html", "text/css", "text/plain", "application/javascript", "application/json", "image/svg+xml")
+
+metrics.register("page_cache_hits_total", "counter", "Rendered-page cache hits.")
+metrics.register("page_cache_misses_total", "counter", "Rendered-page cache misses (page rendered).")
+metrics.register("http_not_modified_total", "counter", "Requests answered 304 from an ETag.")
+
+_lock = threading.Lock()
+_hashes = {}  # static filename -> (stamp, hash)
+_pages = OrderedDict()  # key -> (etag, body, {encoding: bytes})
+_static_bodies = OrderedDict()  # (filename, hash, encoding) -> bytes
+
+def static_hash(static_folder: str, filename: str) -> str:
+    """
+    Short content hash of a static file, recomputed only when it changes on disk.
+    """
+    path = os.path.join(static_folder, filename)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    stamp = (st.st_mtime_ns, st.st_size)
+    hit = _hashes.get(filename)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    digest = h.hexdigest()[:12]
+    _hashes[filename] = (stamp, digest)
+    return digest
+
+def _encoding() -> str:
+    accept = request.headers.get("Accept-Encoding", "").lower()
+    offered = {part.split(";")[0].strip() for part in accept.split(",")}
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return ""
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=min(11, COMPRESS_LEVEL + 3))
+    return gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+def _remember(cache: OrderedDict, key, value, limit: int):
+    with _lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+def cached_page(key, render, cache_control: str = "no-cache") -> Response:
+    """
+    Serves `render()` (a str) from a per-process cache under `key`, with a
+    weak ETag; the key must change whenever the page would. Compressed
+    copies are kept alongside so a hit costs no rendering and no gzip.
+    """
+    entry = _pages.get(key)
+    if entry is None:
+        metrics.inc("page_cache_misses_total")
+        body = render().encode("utf-8")
+        entry = (hashlib.sha1(body).hexdigest()[:16], body, {})
+        _remember(_pages, key, entry, PAGE_CACHE_SIZE)
+    else:
+        metrics.inc("page_cache_hits_total")
+    etag, body, variants = entry
+
+    resp = Response(body, mimetype="text/html")
+    resp.set_etag(etag, weak=True)
+    resp.headers["Cache-Control"] = cache_control
+    resp.make_conditional(request)
+    if resp.status_code == 304:
+        metrics.inc("http_not_modified_total")
+        return resp
+
+    encoding = _encoding()
+    if encoding and len(body) >= COMPRESS_MIN_BYTES:
+        packed = variants.get(encoding)
+        if packed is None:
+            packed = variants[encoding] = _compress(body, encoding)
+        resp.set_data(packed)
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+def _compress_response(response: Response):
+    # generators (exports) stream as they are; send_file bodies are fine to read
+    if response.status_code != 200 or (response.is_streamed and not response.direct_passthrough):
+        return
+    if "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE:
+        return
+    encoding = _encoding()
+    response.vary.add("Accept-Encoding")
+    if not encoding:
+        return
+
+    static_key = None
+    if request.endpoint == "static" and request.args.get("v"):
+        # a ?v= URL names one version of the file, so its compressed copy can be kept
+        filename = (request.view_args or {}).get("filename", "")
+        static_key = (filename, request.args["v"], encoding)
+        packed = _static_bodies.get(static_key)
+        if packed is not None:
+            response.direct_passthrough = False
+            response.set_data(packed)
+            response.headers["Content-Encoding"] = encoding
+            return
+
+    response.direct_passthrough = False
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return
+    packed = _compress(body, encoding)
+    if static_key is not None:
+        _remember(_static_bodies, static_key, packed, 64)
+    response.set_data(packed)
+    response.headers["Content-Encoding"] = encoding
+
+def init_app(app):
+    @app.url_defaults
+    def _fingerprint_static(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            digest = static_hash(app.static_folder, values["filename"])
+            if digest:
+                values["v"] = digest
+
+    @app.after_request
+    def _deliver(response):
+        if request.endpoint == "static" and response.status_code in (200, 304):
+            filename = (request.view_args or {}).get("filename", "")
+            v = request.args.get("v", "")
+            if v and v == static_hash(app.static_folder, filename):
+                response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+        _compress_response(response)
+        return response
@@ -0,0 +1,139 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services import metrics
+
+# Separate connect/read budgets: a dead host fails in ~3s instead of tying a
+# sync worker up for the old blanket 30s.
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.25"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+
+# host -> upstream name used for timeouts and latency stats
+UPSTREAMS = {
+    "api.shiplogic.com": "shiplogic",
+    "api-pudo.co.za": "courier_guy",
+    "payments.yoco.com": "yoco",
+}
+
+# Per-upstream read timeout defaults; override with HTTP_READ_TIMEOUT_<NAME>.
+READ_TIMEOUTS = {
+    "shiplogic": 8.0,
+    "courier_guy": 8.0,
+    "yoco": 15.0,
+}
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {429, 502, 503, 504}
+
+_lock = threading.Lock()
+_sessions = {}
+_sessions_pid = None
+
+def upstream_for(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return UPSTREAMS.get(host, host or "unknown")
+
+def _rebase(url: str, upstream: str) -> str:
+    """
+    UPSTREAM_BASE_<NAME> points an upstream somewhere else without touching
+    the caller, e.g. UPSTREAM_BASE_YOCO=http://127.0.0.1:9102 for bench/ stubs.
+    """
+    base = os.getenv(f"UPSTREAM_BASE_{upstream.upper()}", "").strip().rstrip("/")
+    if not base:
+        return url
+    parts = urlsplit(url)
+    return base + url[len(f"{parts.scheme}://{parts.netloc}"):]
+
+def _session_for(url: str) -> requests.Session:
+    """
+    One keep-alive Session per scheme+host, per process. Rebuilt after a fork
+    so gunicorn workers never share sockets with the master.
+    """
+    global _sessions_pid
+    parts = urlsplit(url)
+    base = f"{parts.scheme}://{parts.netloc}"
+    with _lock:
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        s = _sessions.get(base)
+        if s is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+            s.mount(base, adapter)
+            _sessions[base] = s
+        return s
+
+def _timeouts(upstream: str, timeout):
+    if isinstance(timeout, tuple):
+        return timeout
+    read = float(os.getenv(f"HTTP_READ_TIMEOUT_{upstream.upper()}", "") or READ_TIMEOUTS.get(upstream, HTTP_READ_TIMEOUT))
+    if timeout is not None:
+        # a caller's single number is treated as an upper bound, not a target
+        read = min(read, float(timeout))
+    return (min(HTTP_CONNECT_TIMEOUT, read), read)
+
+def _record(upstream: str, seconds: float, outcome: str):
+    metrics.observe("upstream_request_duration_seconds", seconds, upstream=upstream)
+    metrics.inc("upstream_requests_total", upstream=upstream, outcome=outcome)
+
+def _backoff(attempt: int):
+    # full jitter: spreads retries from many workers instead of syncing them up
+    time.sleep(random.uniform(0, HTTP_BACKOFF * (2 ** attempt)))
+
+def request(method: str, url: str, *, upstream: str = None, timeout=None, idempotent: bool = None, **kwargs) -> requests.Response:
+    """
+    Sends a request over the pooled Session for the url's host.
+
+    Retries (with jittered backoff) only what is safe to repeat: connect
+    timeouts always, everything else only for idempotent calls - GET-like
+    methods, requests carrying an Idempotency-Key, or idempotent=True.
+    """
+    method = method.upper()
+    name = upstream or upstream_for(url)
+    if idempotent is None:
+        headers = kwargs.get("headers") or {}
+        idempotent = method in IDEMPOTENT_METHODS or "Idempotency-Key" in headers
+    timeouts = _timeouts(name, timeout)
+    url = _rebase(url, name)
+    attempts = 1 + max(0, HTTP_RETRIES)
+    session = _session_for(url)
+
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+        start = time.perf_counter()
+        try:
+            r = session.request(method, url, timeout=timeouts, **kwargs)
+        except requests.exceptions.ConnectTimeout:
+            _record(name, time.perf_counter() - start, "timeout")
+            if last:
+                raise
+        except requests.exceptions.ReadTimeout:
+            _record(name, time.perf_counter() - start, "timeout")
+            if last or not idempotent:
+                raise
+        except requests.exceptions.ConnectionError:
+            _record(name, time.perf_counter() - start, "error")
+            if last or not idempotent:
+                raise
+        else:
+            _record(name, time.perf_counter() - start, f"{r.status_code // 100}xx")
+            if last or not idempotent or r.status_code not in RETRY_STATUSES:
+                return r
+            r.close()
+        _backoff(attempt)
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
@@ -0,0 +1,80 @@
+"""
+Responsive <picture> markup from the manifest tools/build_images.py writes.
+
+Templates call picture("img/first-pour-gin.jpg", alt=..., sizes=...). With
+no manifest (or an image missing from it) this falls back to a plain <img>
+of the original file, so a deploy that skipped the build still works.
+"""
+import json
+import os
+import threading
+
+from flask import url_for
+from markupsafe import Markup, escape
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMAGE_MANIFEST = os.getenv("IMAGE_MANIFEST", "").strip() or os.path.join(_ROOT, "static", "img", "build", "manifest.json")
+# Width of the <img src> fallback for browsers without srcset.
+FALLBACK_WIDTH = 640
+
+MIME = {"avif": "image/avif", "webp": "image/webp"}
+
+_manifest = {}
+_stamp = None
+_lock = threading.Lock()
+
+def manifest() -> dict:
+    """
+    image path -> entry, reloaded when the manifest file changes.
+    """
+    global _manifest, _stamp
+    try:
+        st = os.stat(IMAGE_MANIFEST)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = None
+    if stamp != _stamp:
+        with _lock:
+            if stamp != _stamp:
+                try:
+                    with open(IMAGE_MANIFEST, encoding="utf-8") as f:
+                        _manifest = json.load(f).get("images", {})
+                except (OSError, ValueError):
+                    _manifest = {}
+                _stamp = stamp
+    return _manifest
+
+def version():
+    """
+    Changes whenever the manifest does; for page cache keys.
+    """
+    manifest()
+    return _stamp
+
+def _srcset(items) -> str:
+    return ", ".join(f"{url_for('static', filename=path)} {w}w" for w, path in items)
+
+def picture(filename: str, alt: str = "", sizes: str = "100vw", loading: str = "lazy", **attrs) -> Markup:
+    """
+    <picture> with AVIF/WebP sources and a JPEG <img>, or a plain <img>.
+    Extra keyword arguments become <img> attributes (class_ -> class).
+    """
+    entry = manifest().get(filename)
+    extra = "".join(f' {k.rstrip("_")}="{escape(v)}"' for k, v in attrs.items())
+    if not entry or not entry.get("variants", {}).get("jpeg"):
+        return Markup(f'<img src="{url_for("static", filename=filename)}" alt="{escape(alt)}" loading="{loading}"{extra}>')
+
+    variants = entry["variants"]
+    jpeg = variants["jpeg"]
+    fallback = next((path for w, path in jpeg if w >= FALLBACK_WIDTH), jpeg[-1][1])
+    sources = "".join(
+        f'<source type="{MIME[fmt]}" srcset="{_srcset(variants[fmt])}" sizes="{escape(sizes)}">'
+        for fmt in ("avif", "webp") if variants.get(fmt)
+    )
+    return Markup(
+        f"<picture>{sources}"
+        f'<img src="{url_for("static", filename=fallback)}" srcset="{_srcset(jpeg)}" sizes="{escape(sizes)}"'
+        f' width="{entry["width"]}" height="{entry["height"]}" alt="{escape(alt)}" loading="{loading}" decoding="async"{extra}>'
+        f"</picture>"
+    )
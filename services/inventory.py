@@ -0,0 +1,202 @@
+"""
+Stock for limited drops, shared by every gunicorn worker through SQLite.
+
+A product is tracked only if products.json gives it a "stock" count; the
+rest are unlimited. Editing that count sets the on-hand level (a restock).
+Paying reserves stock for RESERVATION_TTL seconds; Yoco's payment webhook
+commits the reservation (on_hand goes down), cancel/failure releases it, and
+a sweeper thread expires the ones nobody paid for. Every change runs in
+BEGIN IMMEDIATE, so two workers can't both sell the last bottle.
+
+Pages read availability from available(), a per-process snapshot refreshed
+at most every INVENTORY_SNAPSHOT_TTL seconds with one query.
+"""
+import logging
+import os
+import threading
+import time
+
+from services import catalog, db, metrics
+
+log = logging.getLogger(__name__)
+
+INVENTORY_DB = os.getenv("INVENTORY_DB", "").strip() or db.data_path("inventory.sqlite3")
+# How long stock is held for a shopper who has gone to pay.
+RESERVATION_TTL = int(os.getenv("RESERVATION_TTL", "900"))
+INVENTORY_SNAPSHOT_TTL = float(os.getenv("INVENTORY_SNAPSHOT_TTL", "2"))
+INVENTORY_SWEEP_INTERVAL = int(os.getenv("INVENTORY_SWEEP_INTERVAL", "60"))
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS stock ("
+    " product_id TEXT PRIMARY KEY, on_hand INTEGER NOT NULL, reserved INTEGER NOT NULL DEFAULT 0,"
+    " seeded INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS reservations ("
+    " order_id TEXT NOT NULL, product_id TEXT NOT NULL, qty INTEGER NOT NULL,"
+    " state TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (order_id, product_id))",
+    "CREATE INDEX IF NOT EXISTS reservations_expiry ON reservations (state, expires_at)",
+)
+
+metrics.register("stock_reservations_total", "counter", "Stock reservation calls, by outcome (held, short, committed, released, expired).")
+
+_lock = threading.Lock()
+_snapshot = None
+_snapshot_at = 0.0
+_seeded_version = None
+
+def _conn():
+    return db.connect(INVENTORY_DB, SCHEMA)
+
+def sync(snap=None):
+    """
+    Brings the stock table in line with the catalog's "stock" counts.
+    Cheap when the catalog hasn't changed since the last call.
+    """
+    global _seeded_version
+    snap = snap or catalog.current()
+    if snap.version == _seeded_version:
+        return
+    counts = {p["id"]: int(p["stock"]) for p in snap.products if p.get("stock") is not None}
+
+    with db.transaction(_conn()) as conn:
+        rows = dict(conn.execute("SELECT product_id, seeded FROM stock").fetchall())
+        for pid, count in counts.items():
+            if pid not in rows:
+                conn.execute("INSERT INTO stock (product_id, on_hand, reserved, seeded) VALUES (?, ?, 0, ?)", (pid, count, count))
+            elif rows[pid] != count:
+                log.info("stock for %s set to %d (was seeded %d)", pid, count, rows[pid])
+                conn.execute("UPDATE stock SET on_hand = ?, seeded = ? WHERE product_id = ?", (count, count, pid))
+        for pid in set(rows) - set(counts):
+            conn.execute("DELETE FROM stock WHERE product_id = ?", (pid,))
+    _seeded_version = snap.version
+    _invalidate()
+
+def _invalidate():
+    global _snapshot_at
+    _snapshot_at = 0.0
+
+def available() -> dict:
+    """
+    product_id -> units that can still be sold, for tracked products only
+    (missing means unlimited). Shared per process and at most
+    INVENTORY_SNAPSHOT_TTL seconds old.
+    """
+    global _snapshot, _snapshot_at
+    _start_sweeper()
+    snap = _snapshot
+    if snap is not None and time.monotonic() - _snapshot_at < INVENTORY_SNAPSHOT_TTL:
+        return snap
+    with _lock:
+        if _snapshot is not None and time.monotonic() - _snapshot_at < INVENTORY_SNAPSHOT_TTL:
+            return _snapshot
+        sync()
+        rows = _conn().execute("SELECT product_id, on_hand - reserved FROM stock").fetchall()
+        _snapshot = {pid: max(0, int(n)) for pid, n in rows}
+        _snapshot_at = time.monotonic()
+        return _snapshot
+
+def reserve(order_id: str, items: dict, ttl: int = None):
+    """
+    Holds `items` (product_id -> qty) for order_id, all or nothing.
+    Returns {} on success, else product_id -> units available for the lines
+    that can't be met (nothing is held then).
+    """
+    sync()
+    expires_at = time.time() + (RESERVATION_TTL if ttl is None else ttl)
+
+    short = {}
+    with db.transaction(_conn()) as conn:
+        wanted = []
+        for pid, qty in items.items():
+            qty = int(qty)
+            row = conn.execute("SELECT on_hand - reserved FROM stock WHERE product_id = ?", (pid,)).fetchone()
+            if row is None or qty <= 0:
+                continue  # not tracked
+            if row[0] < qty:
+                short[pid] = max(0, int(row[0]))
+            wanted.append((pid, qty))
+        if not short:
+            for pid, qty in wanted:
+                conn.execute("UPDATE stock SET reserved = reserved + ? WHERE product_id = ?", (qty, pid))
+                conn.execute(
+                    "INSERT INTO reservations (order_id, product_id, qty, state, expires_at) VALUES (?, ?, ?, 'held', ?)",
+                    (order_id, pid, qty, expires_at),
+                )
+    metrics.inc("stock_reservations_total", outcome="short" if short else "held")
+    _invalidate()
+    return short
+
+def held(order_id: str) -> dict:
+    """
+    product_id -> units order_id still holds (unpaid, unexpired).
+    """
+    if not order_id:
+        return {}
+    return dict(_conn().execute(
+        "SELECT product_id, qty FROM reservations WHERE order_id = ? AND state = 'held'", (order_id,)
+    ).fetchall())
+
+def rename(old_id: str, new_id: str):
+    """
+    Moves a reservation to its final order id (the Yoco route picks the id
+    after the stock is already held).
+    """
+    _conn().execute("UPDATE reservations SET order_id = ? WHERE order_id = ?", (new_id, old_id))
+
+def commit(order_id: str):
+    """
+    The order was paid: its units leave on_hand, even if the hold already
+    expired or was released (the shopper opened the cancel page after paying).
+    Committing twice changes nothing.
+    """
+    with db.transaction(_conn()) as conn:
+        rows = conn.execute(
+            "SELECT product_id, qty, state FROM reservations WHERE order_id = ? AND state IN ('held', 'expired', 'released')",
+            (order_id,),
+        ).fetchall()
+        for pid, qty, state in rows:
+            held = qty if state == "held" else 0
+            conn.execute("UPDATE stock SET on_hand = on_hand - ?, reserved = reserved - ? WHERE product_id = ?", (qty, held, pid))
+            if state != "held":
+                log.warning("order %s paid after its reservation was %s; %s may be oversold", order_id, state, pid)
+        conn.execute(
+            "UPDATE reservations SET state = 'committed' WHERE order_id = ? AND state IN ('held', 'expired', 'released')",
+            (order_id,),
+        )
+    if rows:
+        metrics.inc("stock_reservations_total", outcome="committed")
+        _invalidate()
+
+def release(order_id: str, state: str = "released"):
+    """
+    Returns an order's held units to stock.
+    """
+    with db.transaction(_conn()) as conn:
+        rows = conn.execute("SELECT product_id, qty FROM reservations WHERE order_id = ? AND state = 'held'", (order_id,)).fetchall()
+        for pid, qty in rows:
+            conn.execute("UPDATE stock SET reserved = reserved - ? WHERE product_id = ?", (qty, pid))
+        conn.execute("UPDATE reservations SET state = ? WHERE order_id = ? AND state = 'held'", (state, order_id))
+    if rows:
+        metrics.inc("stock_reservations_total", outcome=state)
+        _invalidate()
+
+def sweep() -> int:
+    """
+    Expires held reservations past their deadline; returns how many orders.
+    """
+    rows = _conn().execute(
+        "SELECT DISTINCT order_id FROM reservations WHERE state = 'held' AND expires_at < ?", (time.time(),)
+    ).fetchall()
+    for (order_id,) in rows:
+        release(order_id, state="expired")
+    return len(rows)
+
+def _sweep_forever():
+    while True:
+        time.sleep(INVENTORY_SWEEP_INTERVAL)
+        try:
+            sweep()
+        except Exception:
+            log.exception("reservation sweep failed")
+
+def _start_sweeper():
+    db.start_once("stock-sweeper", _sweep_forever)
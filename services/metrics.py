@@ -0,0 +1,298 @@
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: folding is then unlocked
+    fcntl = None
+
+from services import db
+
+# Each worker dumps its counters here; /admin/metrics sums every file, so the
+# numbers cover all gunicorn workers, not just the one that served the scrape.
+# Files of exited workers are folded into _dead.json, so totals survive
+# restarts and deploys without a dead worker's file being counted forever.
+METRICS_DIR = os.getenv("METRICS_DIR", "").strip() or db.data_path("metrics")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+PREFIX = "firstpour_"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 3072, 4096, 8192)
+
+HELP = {
+    "http_requests_total": ("counter", "Requests served, by route, method and status."),
+    "http_request_duration_seconds": ("histogram", "Time spent in a Flask route."),
+    "upstream_requests_total": ("counter", "Outbound HTTP attempts, by upstream and outcome."),
+    "upstream_request_duration_seconds": ("histogram", "Outbound HTTP attempt latency, by upstream."),
+    "session_cookie_bytes": ("histogram", "Size of the session cookie sent by the browser."),
+}
+
+class Histogram:
+    """
+    Fixed-bucket histogram. Not thread-safe on its own; callers hold the module lock.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = 0
+        for b in self.buckets:
+            if value <= b:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_histograms = {}  # (name, labels) -> Histogram
+_collectors = []  # callables returning [(name, labels dict, value)], sampled at flush
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name: str, value: float = 1, **labels):
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+def observe(name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+    k = _key(name, labels)
+    with _lock:
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = Histogram(buckets)
+        h.observe(value)
+
+def register(name: str, kind: str, help_text: str):
+    HELP[name] = (kind, help_text)
+
+def register_collector(fn):
+    """
+    fn() -> [(name, labels, value)] of per-process counters owned elsewhere
+    (e.g. cache hit counts), copied into the snapshot at every flush.
+    """
+    _collectors.append(fn)
+
+def _snapshot() -> dict:
+    counters = []
+    for fn in _collectors:
+        try:
+            for name, labels, value in fn():
+                counters.append([name, sorted((k, str(v)) for k, v in labels.items()), value])
+        except Exception:
+            pass
+    with _lock:
+        counters += [[name, list(labels), v] for (name, labels), v in _counters.items()]
+        histograms = [
+            [name, list(labels), list(h.buckets), list(h.counts), h.total, h.count]
+            for (name, labels), h in _histograms.items()
+        ]
+    return {"pid": os.getpid(), "counters": counters, "histograms": histograms}
+
+DEAD_FILE = "_dead.json"
+
+_own = None  # (pid, file name)
+
+def _own_file() -> str:
+    # pid plus a per-process suffix: a reused pid never overwrites an old worker's numbers
+    global _own
+    pid = os.getpid()
+    if _own is None or _own[0] != pid:
+        _own = (pid, f"{pid}-{uuid.uuid4().hex[:8]}.json")
+    return _own[1]
+
+def _write(path: str, snap: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snap, f)
+    os.replace(tmp, path)
+
+def flush():
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _write(os.path.join(METRICS_DIR, _own_file()), _snapshot())
+
+def _read(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _merge(counters: dict, histograms: dict, snap: dict):
+    for name, labels, value in snap.get("counters", []):
+        k = (name, tuple(tuple(x) for x in labels))
+        counters[k] = counters.get(k, 0) + value
+    for name, labels, buckets, counts, total, count in snap.get("histograms", []):
+        k = (name, tuple(tuple(x) for x in labels))
+        agg = histograms.get(k)
+        if agg is None or agg[0] != buckets:
+            agg = histograms[k] = [buckets, [0] * len(counts), 0.0, 0]
+        agg[1] = [a + b for a, b in zip(agg[1], counts)]
+        agg[2] += total
+        agg[3] += count
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+def fold_dead() -> int:
+    """
+    Adds the snapshots of processes that have exited into _dead.json and
+    deletes them. Returns how many were folded.
+    """
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with open(os.path.join(METRICS_DIR, ".fold.lock"), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = []
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            name = os.path.basename(path)
+            if name == DEAD_FILE:
+                continue
+            try:
+                pid = int(name[:-len(".json")].split("-")[0])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _alive(pid):
+                dead.append(path)
+        if not dead:
+            return 0
+        counters, histograms = {}, {}
+        dead_path = os.path.join(METRICS_DIR, DEAD_FILE)
+        for path in [dead_path] + dead:
+            _merge(counters, histograms, _read(path))
+        _write(dead_path, {
+            "pid": None,
+            "counters": [[name, [list(x) for x in labels], v] for (name, labels), v in counters.items()],
+            "histograms": [[name, [list(x) for x in labels], *agg] for (name, labels), agg in histograms.items()],
+        })
+        for path in dead:
+            os.remove(path)
+        return len(dead)
+
+def _flush_forever():
+    try:
+        fold_dead()
+    except Exception:
+        pass
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            pass
+
+def start_flusher():
+    """
+    One daemon thread per worker process; safe to call on every request.
+    """
+    db.start_once("metrics-flush", _flush_forever)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(pairs, extra=None) -> str:
+    items = list(pairs) + (list(extra) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in items) + "}"
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def render() -> str:
+    """
+    Prometheus text exposition of every worker's last snapshot, summed.
+    """
+    try:
+        flush()  # make sure this worker's latest numbers are included
+    except Exception:
+        pass
+
+    counters = {}
+    histograms = {}
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        _merge(counters, histograms, _read(path))
+
+    out = []
+    seen = set()
+
+    def header(name: str, default_kind: str):
+        if name in seen:
+            return
+        seen.add(name)
+        kind, help_text = HELP.get(name, (default_kind, name))
+        out.append(f"# HELP {PREFIX}{name} {help_text}")
+        out.append(f"# TYPE {PREFIX}{name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, "counter")
+        out.append(f"{PREFIX}{name}{_labels(labels)} {_fmt(value)}")
+
+    # X_hits_total + X_misses_total -> X_hit_ratio, so cache health reads at a glance
+    for (name, labels), hits in sorted(counters.items()):
+        if not name.endswith("_hits_total"):
+            continue
+        base = name[:-len("_hits_total")]
+        misses = counters.get((base + "_misses_total", labels))
+        if misses is None:
+            continue
+        ratio_name = base + "_hit_ratio"
+        if ratio_name not in HELP:
+            HELP[ratio_name] = ("gauge", f"{base} hits / lookups since worker start.")
+        header(ratio_name, "gauge")
+        lookups = hits + misses
+        out.append(f"{PREFIX}{ratio_name}{_labels(labels)} {_fmt(round(hits / lookups, 4) if lookups else 0)}")
+
+    for (name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+        header(name, "histogram")
+        running = 0
+        for b, c in zip(list(buckets) + ["+Inf"], counts):
+            running += c
+            le = "+Inf" if b == "+Inf" else _fmt(b)
+            out.append(f"{PREFIX}{name}_bucket{_labels(labels, [('le', le)])} {running}")
+        out.append(f"{PREFIX}{name}_sum{_labels(labels)} {_fmt(total)}")
+        out.append(f"{PREFIX}{name}_count{_labels(labels)} {count}")
+
+    return "\n".join(out) + "\n"
+
+def init_app(app):
+    """
+    Per-route request counts and latency, plus the size of the incoming
+    session cookie.
+    """
+    from flask import g, request
+
+    cookie_name = app.config.get("SESSION_COOKIE_NAME", "session")
+
+    @app.before_request
+    def _metrics_start():
+        start_flusher()
+        g._metrics_start = time.perf_counter()
+        cookie = request.cookies.get(cookie_name)
+        if cookie is not None:
+            observe("session_cookie_bytes", len(cookie), buckets=SIZE_BUCKETS)
+
+    @app.after_request
+    def _metrics_finish(response):
+        started = g.pop("_metrics_start", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            observe("http_request_duration_seconds", time.perf_counter() - started, route=route)
+            inc("http_requests_total", route=route, method=request.method, status=response.status_code)
+        return response
@@ -0,0 +1,31 @@
+"""
+Post-payment side effects, run by the task worker (see services/tasks.py).
+
+Order events go to the ORDER_WEBHOOK_URL setting as JSON (an automation hook
+that sends the confirmation email / WhatsApp to WHATSAPP_NUMBER and alerts
+the admin). Unset, the event is only logged. The request carries an
+Idempotency-Key of event:order_id, since a retried task may deliver the same
+event twice. The URL is read per task, so a SIGHUP reload of the worker
+picks up a new one; the concurrency is fixed when the worker starts.
+"""
+import logging
+
+from services import http_client, settings, tasks
+
+log = logging.getLogger(__name__)
+
+@tasks.task("order_webhook", concurrency=settings.current().order_webhook_concurrency, max_attempts=10, timeout=60)
+def order_webhook(payload: dict):
+    url = settings.current().order_webhook_url
+    if not url:
+        log.info("order %s %s (ORDER_WEBHOOK_URL not set)", payload.get("order_id"), payload.get("event"))
+        return
+    r = http_client.post(
+        url,
+        json=payload,
+        headers={"Idempotency-Key": f"{payload.get('event')}:{payload.get('order_id')}"},
+        upstream="order_webhook",
+        timeout=20,
+    )
+    if r.status_code >= 300:
+        raise RuntimeError(f"webhook answered {r.status_code}: {r.text[:200]}")
@@ -0,0 +1,168 @@
+"""
+Order journal: an append-only SQLite log of what happened to each order
+(checkout_started, returned_success, cancelled, failed, paid). "paid" is
+only written for a payment Yoco confirmed by webhook; the others come from
+the shopper's browser.
+
+Request threads only put events on a queue. A writer thread per worker
+drains it in batches, one transaction (and so one fsync) per batch, so a
+checkout never waits on the disk. The file is WAL with synchronous=FULL on
+the writer: a committed batch survives a crash; an event still queued when
+the process is killed outright is lost. Normal shutdown drains the queue.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+
+from services import db, metrics
+
+log = logging.getLogger(__name__)
+
+ORDERS_DB = os.getenv("ORDERS_DB", "").strip() or db.data_path("orders.sqlite3")
+# Longest an event waits in memory before it's written.
+ORDERS_FLUSH_INTERVAL = float(os.getenv("ORDERS_FLUSH_INTERVAL", "0.2"))
+ORDERS_BATCH_MAX = int(os.getenv("ORDERS_BATCH_MAX", "200"))
+
+COLUMNS = (
+    "seq", "at", "order_id", "event", "amount_cents", "subtotal_cents", "delivery_cents",
+    "delivery_method", "customer_name", "customer_phone", "customer_email", "items", "detail",
+)
+
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+metrics.register("order_events_total", "counter", "Order journal events queued, by event.")
+metrics.register("order_journal_batch_size", "histogram", "Events written per journal transaction.")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS order_events ("
+    " seq INTEGER PRIMARY KEY AUTOINCREMENT, at REAL NOT NULL, order_id TEXT NOT NULL, event TEXT NOT NULL,"
+    " amount_cents INTEGER, subtotal_cents INTEGER, delivery_cents INTEGER, delivery_method TEXT,"
+    " customer_name TEXT, customer_phone TEXT, customer_email TEXT, items TEXT, detail TEXT)",
+    "CREATE INDEX IF NOT EXISTS order_events_order ON order_events (order_id)",
+)
+
+_queue = queue.Queue()
+
+def _conn(writer: bool = False):
+    conn = db.connect(ORDERS_DB, SCHEMA)
+    if writer:
+        conn.execute("PRAGMA synchronous=FULL")
+    return conn
+
+def record(event: str, order_id: str, *, amount_cents=None, subtotal_cents=None, delivery_cents=None,
+           delivery_method="", customer_name="", customer_phone="", customer_email="", items=None, detail=None):
+    """
+    Queues one journal event; returns immediately.
+    """
+    if not order_id:
+        return
+    _start_writer()
+    _queue.put((
+        time.time(), order_id, event, amount_cents, subtotal_cents, delivery_cents, delivery_method or "",
+        customer_name or "", customer_phone or "", customer_email or "",
+        json.dumps(items, separators=(",", ":")) if items is not None else None,
+        json.dumps(detail, separators=(",", ":")) if detail is not None else None,
+    ))
+    metrics.inc("order_events_total", event=event)
+
+def _write(batch: list):
+    with db.transaction(_conn(writer=True)) as conn:
+        conn.executemany(
+            "INSERT INTO order_events (at, order_id, event, amount_cents, subtotal_cents, delivery_cents,"
+            " delivery_method, customer_name, customer_phone, customer_email, items, detail)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+    metrics.observe("order_journal_batch_size", len(batch), buckets=BATCH_BUCKETS)
+
+def flush(block: bool = True, timeout: float = None) -> int:
+    """
+    Writes whatever is queued (waiting up to `timeout` for the first event
+    when block is set). Returns the number of events written.
+    """
+    try:
+        batch = [_queue.get(block=block, timeout=timeout)]
+    except queue.Empty:
+        return 0
+    deadline = time.monotonic() + ORDERS_FLUSH_INTERVAL if block else 0
+    while len(batch) < ORDERS_BATCH_MAX:
+        try:
+            batch.append(_queue.get(timeout=max(0.0, deadline - time.monotonic())) if block else _queue.get_nowait())
+        except queue.Empty:
+            break
+    for attempt in range(3):
+        try:
+            _write(batch)
+            return len(batch)
+        except Exception:
+            log.exception("order journal write failed (attempt %d, %d events)", attempt + 1, len(batch))
+            time.sleep(0.5 * (attempt + 1))
+    log.error("order journal dropped %d events: %s", len(batch), batch)
+    return 0
+
+def _write_forever():
+    while True:
+        flush(block=True)
+
+def _drain():
+    while flush(block=False):
+        pass
+
+def _start_writer():
+    db.start_once("order-journal", _write_forever)
+
+atexit.register(_drain)
+
+def iter_events(after: int = 0, limit: int = None, page: int = 500):
+    """
+    Journal rows (as dicts, oldest first) with seq > after. Reads `page` rows
+    at a time, so exporting the whole history never holds it all in memory.
+    Pass the last seq seen as `after` to resume.
+    """
+    conn = _conn()
+    remaining = limit
+    cursor = int(after or 0)
+    while remaining is None or remaining > 0:
+        n = page if remaining is None else min(page, remaining)
+        rows = conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM order_events WHERE seq > ? ORDER BY seq LIMIT ?", (cursor, n)
+        ).fetchall()
+        for row in rows:
+            yield dict(zip(COLUMNS, row))
+        if len(rows) < n:
+            return
+        cursor = rows[-1][0]
+        if remaining is not None:
+            remaining -= len(rows)
+
+SNAPSHOT = ("amount_cents", "subtotal_cents", "delivery_cents", "delivery_method",
+            "customer_name", "customer_phone", "customer_email", "items")
+
+def checkout_snapshot(order_id: str):
+    """
+    Amounts, customer and items as journaled when the order's checkout
+    started, or None if that event isn't on disk.
+    """
+    row = _conn().execute(
+        f"SELECT {', '.join(SNAPSHOT)} FROM order_events WHERE order_id = ? AND event = 'checkout_started'"
+        " ORDER BY seq DESC LIMIT 1",
+        (order_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    snap = dict(zip(SNAPSHOT, row))
+    snap["items"] = json.loads(snap["items"]) if snap["items"] else []
+    return snap
+
+def to_ndjson(row: dict) -> str:
+    """
+    One export line, with items/detail decoded rather than double-encoded.
+    """
+    out = dict(row)
+    for k in ("items", "detail"):
+        if out[k]:
+            out[k] = json.loads(out[k])
+    return json.dumps(out, ensure_ascii=False) + "\n"
@@ -0,0 +1,88 @@
+"""
+Double-submit guard for starting a Yoco checkout.
+
+A double click or a back-button retry on "Pay" would otherwise create a
+second Yoco checkout. Each attempt is fingerprinted (session token, cart,
+amounts); the first one claims the fingerprint, and repeats within
+PAY_DEDUP_WINDOW get the same redirectUrl instead of a new checkout. A
+repeat that arrives while the first is still talking to Yoco waits for it.
+State is in SQLite so the guard holds across gunicorn workers.
+"""
+import hashlib
+import os
+import time
+
+from services import db, metrics
+
+PAY_DEDUP_DB = os.getenv("PAY_DEDUP_DB", "").strip() or db.data_path("pay_dedup.sqlite3")
+# How long a started checkout is handed back to repeats of the same payment.
+PAY_DEDUP_WINDOW = int(os.getenv("PAY_DEDUP_WINDOW", "300"))
+# How long a repeat waits for an in-flight start (Yoco's own timeout is 30s).
+PAY_DEDUP_WAIT = float(os.getenv("PAY_DEDUP_WAIT", "35"))
+
+metrics.register("pay_dedup_total", "counter", "Yoco checkout starts by dedup outcome (started, replayed, waited, gave_up).")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS pay_pending ("
+    " fp TEXT PRIMARY KEY, token TEXT NOT NULL, url TEXT, created_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS pay_pending_token ON pay_pending (token)",
+    "CREATE INDEX IF NOT EXISTS pay_pending_created ON pay_pending (created_at)",
+)
+
+def _conn():
+    return db.connect(PAY_DEDUP_DB, SCHEMA)
+
+def fingerprint(token: str, cart: dict, subtotal_cents: int, delivery_method: str, delivery_fee_cents: int) -> str:
+    items = ",".join(f"{pid}:{int(qty)}" for pid, qty in sorted((cart or {}).items()))
+    raw = f"{token}|{items}|{int(subtotal_cents)}|{delivery_method}|{int(delivery_fee_cents)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def claim(fp: str, token: str):
+    """
+    ("start", None) if the caller should create the checkout, ("replay", url)
+    if one already exists, or ("busy", None) if another request is creating it.
+    """
+    now = time.time()
+    with db.transaction(_conn()) as conn:
+        conn.execute("DELETE FROM pay_pending WHERE created_at < ?", (now - max(PAY_DEDUP_WINDOW, PAY_DEDUP_WAIT),))
+        row = conn.execute("SELECT url, created_at FROM pay_pending WHERE fp = ?", (fp,)).fetchone()
+        url, created_at = row if row is not None else (None, 0.0)
+        if url and created_at >= now - PAY_DEDUP_WINDOW:
+            return "replay", url
+        if row is not None and not url and created_at >= now - PAY_DEDUP_WAIT:
+            return "busy", None
+        # nothing usable (or an abandoned claim): this request starts the checkout
+        conn.execute(
+            "INSERT OR REPLACE INTO pay_pending (fp, token, url, created_at) VALUES (?, ?, NULL, ?)",
+            (fp, token, now),
+        )
+    return "start", None
+
+def wait_for(fp: str, timeout: float = None):
+    """
+    Polls for the redirectUrl of an in-flight start; None if it failed or
+    didn't finish in time.
+    """
+    deadline = time.monotonic() + (PAY_DEDUP_WAIT if timeout is None else timeout)
+    conn = _conn()
+    while time.monotonic() < deadline:
+        row = conn.execute("SELECT url FROM pay_pending WHERE fp = ?", (fp,)).fetchone()
+        if row is None:
+            return None  # the first attempt failed and released its claim
+        if row[0]:
+            return row[0]
+        time.sleep(0.1)
+    return None
+
+def complete(fp: str, url: str):
+    _conn().execute("UPDATE pay_pending SET url = ?, created_at = ? WHERE fp = ?", (url, time.time(), fp))
+
+def release(fp: str):
+    _conn().execute("DELETE FROM pay_pending WHERE fp = ? AND url IS NULL", (fp,))
+
+def forget(token: str, keep: str = ""):
+    """
+    Drops every started checkout for a session (after it paid, cancelled or
+    failed), except fingerprint `keep`.
+    """
+    _conn().execute("DELETE FROM pay_pending WHERE token = ? AND fp != ?", (token, keep))
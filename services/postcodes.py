@@ -0,0 +1,110 @@
+import csv
+import os
+import re
+import threading
+from bisect import bisect_left
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# suburb,city,code,zone - zone is the Shiplogic province name. The bundled file
+# covers the main towns and suburbs; swap in a full SAPO export in the same
+# format to widen it. Codes missing from the file are never rejected.
+POSTCODES_PATH = os.getenv("POSTCODES_PATH", "").strip() or os.path.join(_ROOT, "data", "za_postcodes.csv")
+
+_CODE_RE = re.compile(r"^\d{4}$")
+
+def _fold(s: str) -> str:
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", (s or "").lower()).split())
+
+class Place:
+    __slots__ = ("suburb", "city", "code", "zone")
+
+    def __init__(self, suburb: str, city: str, code: str, zone: str):
+        self.suburb = suburb
+        self.city = city
+        self.code = code
+        self.zone = zone
+
+    def as_dict(self) -> dict:
+        return {"suburb": self.suburb, "city": self.city, "code": self.code, "zone": self.zone}
+
+class PostcodeIndex:
+    """
+    Sorted array of folded keys (suburb, city, postal code) -> place ids, so a
+    prefix lookup is one bisect plus a short forward scan.
+    """
+
+    def __init__(self, places):
+        self.places = tuple(places)
+        pairs = set()
+        for i, p in enumerate(self.places):
+            for key in (_fold(p.suburb), _fold(p.city), p.code):
+                if key:
+                    pairs.add((key, i))
+        pairs = sorted(pairs)
+        self._keys = [k for k, _ in pairs]
+        self._ids = [i for _, i in pairs]
+
+        self.zones_by_code = {}
+        for p in self.places:
+            self.zones_by_code.setdefault(p.code, set()).add(p.zone)
+
+    @classmethod
+    def from_csv(cls, path: str):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+        places = []
+        for r in rows:
+            code = (r.get("code") or "").strip().zfill(4)
+            if not _CODE_RE.match(code):
+                continue
+            places.append(Place((r.get("suburb") or "").strip(), (r.get("city") or "").strip(), code, (r.get("zone") or "").strip()))
+        return cls(places)
+
+    def search(self, query: str, limit: int = 10) -> list:
+        q = _fold(query)
+        if not q:
+            return []
+        out = []
+        seen = set()
+        i = bisect_left(self._keys, q)
+        while i < len(self._keys) and self._keys[i].startswith(q) and len(out) < limit:
+            pid = self._ids[i]
+            if pid not in seen:
+                seen.add(pid)
+                out.append(self.places[pid])
+            i += 1
+        return out
+
+    def zone_for_code(self, code: str):
+        """
+        The province for a postal code, or None if unknown or ambiguous.
+        """
+        zones = self.zones_by_code.get((code or "").strip())
+        if zones and len(zones) == 1:
+            return next(iter(zones))
+        return None
+
+    def check(self, code: str, zone: str):
+        """
+        Returns an error message for an address that can't exist, or "".
+        Only provable problems are reported: unknown codes pass.
+        """
+        code = (code or "").strip()
+        if not _CODE_RE.match(code):
+            return "Postal code must be 4 digits."
+        zones = self.zones_by_code.get(code)
+        if zones and zone and zone not in zones:
+            return f"Postal code {code} is in {' / '.join(sorted(zones))}, not {zone}. Check the province."
+        return ""
+
+_index = None
+_lock = threading.Lock()
+
+def index() -> PostcodeIndex:
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = PostcodeIndex.from_csv(POSTCODES_PATH)
+    return _index
@@ -0,0 +1,128 @@
+"""
+Opt-in request profiler (PROFILING=1).
+
+A sampler thread per worker records the stack of every in-flight request
+thread each PROFILE_INTERVAL seconds. When a request ends, its samples are
+kept if it was picked by PROFILE_SAMPLE_RATE or took longer than
+PROFILE_SLOW_MS, and thrown away otherwise. Because sampling happens all the
+time, a slow request is caught without having been chosen up front.
+
+Kept profiles are collapsed stacks ("outer;inner;leaf count" lines, what
+flamegraph.pl and speedscope read) in PROFILE_DIR, newest PROFILE_KEEP only.
+With PROFILING unset, init_app registers nothing, so there is no overhead.
+Stacks come from sys._current_frames(), so this sees threads (sync and
+gthread workers) but not gevent greenlets.
+"""
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+from services import db, metrics
+
+PROFILING = os.getenv("PROFILING", "").strip().lower() in ("1", "true", "yes", "on")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "").strip() or db.data_path("profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_MAX_DEPTH = 96
+
+NAME_RE = re.compile(r"^[\w.-]+\.folded$")
+
+metrics.register("profiles_written_total", "counter", "Request profiles saved, by reason (sampled or slow).")
+
+_active = {}  # thread ident -> Counter of collapsed stacks
+
+def _collapse(frame) -> str:
+    parts = []
+    while frame is not None and len(parts) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
+
+def _sample_forever():
+    me = threading.get_ident()
+    while True:
+        time.sleep(PROFILE_INTERVAL)
+        if not _active:
+            continue
+        frames = sys._current_frames()
+        for ident, stacks in list(_active.items()):
+            frame = frames.get(ident)
+            if frame is not None and ident != me:
+                stacks[_collapse(frame)] += 1
+
+def _start_sampler():
+    db.start_once("profiler", _sample_forever)
+
+def _save(stacks: Counter, route: str, ms: float, reason: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_route = re.sub(r"[^\w-]+", "_", route).strip("_") or "unknown"
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{threading.get_ident() % 100000}-{safe_route}-{int(ms)}ms-{reason}.folded"
+    tmp = os.path.join(PROFILE_DIR, name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp, os.path.join(PROFILE_DIR, name))
+    metrics.inc("profiles_written_total", reason=reason)
+    _trim()
+
+def _trim():
+    files = list_profiles()
+    for entry in files[PROFILE_KEEP:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, entry["name"]))
+        except OSError:
+            pass
+
+def list_profiles() -> list:
+    """
+    Saved profiles, newest first: [{"name", "bytes", "at"}].
+    """
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if NAME_RE.match(n)]
+    except OSError:
+        return []
+    out = []
+    for n in names:
+        try:
+            st = os.stat(os.path.join(PROFILE_DIR, n))
+        except OSError:
+            continue
+        out.append({"name": n, "bytes": st.st_size, "at": st.st_mtime})
+    out.sort(key=lambda e: e["at"], reverse=True)
+    return out
+
+def init_app(app):
+    if not PROFILING:
+        return
+
+    @app.before_request
+    def _profile_start():
+        _start_sampler()
+        g._profile = (time.perf_counter(), random.random() < PROFILE_SAMPLE_RATE, threading.get_ident())
+        _active[threading.get_ident()] = Counter()
+
+    @app.teardown_request
+    def _profile_end(exc):
+        started = g.pop("_profile", None)
+        if started is None:
+            return
+        start, sampled, ident = started
+        stacks = _active.pop(ident, None)
+        ms = (time.perf_counter() - start) * 1000
+        reason = "slow" if PROFILE_SLOW_MS and ms >= PROFILE_SLOW_MS else "sampled" if sampled else ""
+        if not reason or not stacks:
+            return
+        try:
+            _save(stacks, request.url_rule.rule if request.url_rule else request.path, ms, reason)
+        except OSError:
+            app.logger.exception("could not save profile")
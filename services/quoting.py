@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from services import metrics
+from services.carriers import CARRIERS
+
+# Global budget for one quote across all carriers; whatever has arrived by then is used.
+QUOTE_DEADLINE = float(os.getenv("QUOTE_DEADLINE", "2.5"))
+QUOTE_MAX_WORKERS = int(os.getenv("QUOTE_MAX_WORKERS", "8"))
+# Background retries of failed carriers get their own threads, so they never
+# queue ahead of a shopper's quote; past QUOTE_REFRESH_QUEUE waiting or
+# running, further failures aren't retried in the background.
+QUOTE_REFRESH_WORKERS = int(os.getenv("QUOTE_REFRESH_WORKERS", "2"))
+QUOTE_REFRESH_QUEUE = int(os.getenv("QUOTE_REFRESH_QUEUE", "16"))
+# Optional allow-list, e.g. QUOTE_CARRIERS=shiplogic. Default: every carrier with a key.
+QUOTE_CARRIERS = [c.strip() for c in os.getenv("QUOTE_CARRIERS", "").split(",") if c.strip()]
+
+metrics.register("quote_carrier_duration_seconds", "histogram", "Time for one carrier to answer a quote, cache included.")
+metrics.register("quote_carrier_results_total", "counter", "Carrier quote calls, by outcome.")
+metrics.register("quote_carrier_deadline_missed_total", "counter", "Carriers dropped from a quote by QUOTE_DEADLINE.")
+metrics.register("quote_estimates_total", "counter", "Quotes answered from a carrier's last-known-good rates.")
+
+_pools = {}  # name -> (pid, executor)
+_pool_lock = threading.Lock()
+_refreshing = set()
+
+def _executor(name: str = "quote", workers: int = None) -> ThreadPoolExecutor:
+    with _pool_lock:
+        pid, pool = _pools.get(name, (None, None))
+        if pool is None or pid != os.getpid():
+            pool = ThreadPoolExecutor(max_workers=workers or QUOTE_MAX_WORKERS, thread_name_prefix=name)
+            _pools[name] = (os.getpid(), pool)
+        return pool
+
+def _timed(name: str, fn, *args):
+    # whole carrier call, cache lookups included; raw HTTP attempts are timed in http_client
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        result = fn(*args)
+        outcome = "ok"
+        return result
+    finally:
+        metrics.observe("quote_carrier_duration_seconds", time.perf_counter() - start, carrier=name)
+        metrics.inc("quote_carrier_results_total", carrier=name, outcome=outcome)
+
+def _unless_late(start_by: float, name: str, fn, *args):
+    # a call that only gets a thread after the quote's deadline has nobody waiting for it
+    if time.monotonic() >= start_by:
+        metrics.inc("quote_carrier_results_total", carrier=name, outcome="skipped")
+        return []
+    return _timed(name, fn, *args)
+
+def _refresh_later(name: str, delivery_address: dict, lines: list, declared_value: int):
+    """
+    Retries a failed carrier off the request path so a recovered upstream
+    replaces the estimate. While its circuit is open this fails fast.
+    """
+    key = (name, repr(sorted(delivery_address.items())), declared_value)
+    with _pool_lock:
+        if key in _refreshing or len(_refreshing) >= QUOTE_REFRESH_QUEUE:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            _timed(name, CARRIERS[name].fetch, delivery_address, lines, declared_value)
+        except Exception:
+            pass
+        finally:
+            with _pool_lock:
+                _refreshing.discard(key)
+
+    _executor("quote-refresh", QUOTE_REFRESH_WORKERS).submit(run)
+
+def configured_carriers() -> list:
+    names = QUOTE_CARRIERS or list(CARRIERS)
+    return [n for n in names if n in CARRIERS and CARRIERS[n].enabled()]
+
+def quote_all(delivery_address: dict, lines: list, declared_value: int, deadline: float = None):
+    """
+    Asks every configured carrier at once and merges the answers.
+
+    Returns (rates, errors): rates is one list of RateQuote sorted by
+    fee_cents; errors maps carrier -> message for carriers that failed or
+    missed the deadline. A slow or broken carrier only loses its own rates,
+    or is stood in for by its last-known-good rates, so a quote from a
+    carrier in errors is an estimate.
+    """
+    carriers = configured_carriers()
+    if not carriers:
+        raise Exception("No courier connected. Set SHIPLOGIC_API_KEY or COURIERGUY_API_KEY on Render.")
+
+    budget = QUOTE_DEADLINE if deadline is None else deadline
+    start_by = time.monotonic() + budget
+    pool = _executor()
+    futures = {
+        pool.submit(_unless_late, start_by, name, CARRIERS[name].fetch, delivery_address, lines, declared_value): name
+        for name in carriers
+    }
+    done, pending = wait(futures, timeout=budget)
+
+    rates = []
+    errors = {}
+
+    for fut in done:
+        name = futures[fut]
+        try:
+            rates.extend(fut.result())
+        except Exception as e:
+            errors[name] = str(e)
+            _refresh_later(name, delivery_address, lines, declared_value)
+
+    for fut in pending:
+        # one still queued never starts; one already running is left to finish,
+        # and its late answer lands in the rate cache for the next click
+        fut.cancel()
+        errors[futures[fut]] = "timed out"
+        metrics.inc("quote_carrier_deadline_missed_total", carrier=futures[fut])
+
+    for name in errors:
+        estimate = getattr(CARRIERS[name], "estimate", None)
+        if estimate is None:
+            continue
+        try:
+            stale = estimate(delivery_address, lines, declared_value)
+        except Exception:
+            stale = None
+        if stale:
+            metrics.inc("quote_estimates_total", carrier=name)
+            rates.extend(stale)
+
+    rates.sort(key=lambda q: q.fee_cents)
+    return rates, errors
@@ -0,0 +1,219 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from services import db, metrics
+
+RATE_CACHE_TTL = int(os.getenv("RATE_CACHE_TTL", "21600"))  # 6h: quotes barely move within a day
+RATE_CACHE_SIZE = int(os.getenv("RATE_CACHE_SIZE", "512"))
+# Optional shared backend so every gunicorn worker sees the same entries,
+# e.g. RATE_CACHE_DB=instance/rate_cache.sqlite3. Empty = per-process only.
+RATE_CACHE_DB = os.getenv("RATE_CACHE_DB", "").strip()
+
+def _canon(value) -> str:
+    return " ".join(str(value or "").split()).lower()
+
+def cache_key(delivery_address: dict, declared_value: int, day: str) -> str:
+    """
+    Canonical key for a quote: where it goes, how many bottles, declared value
+    and the collection day (rates are dated, so entries never cross midnight).
+    Street is left out on purpose - couriers price by area, not house number.
+    """
+    a = delivery_address or {}
+    return "|".join([
+        _canon(a.get("type")),
+        _canon(a.get("zone")),
+        _canon(a.get("code")),
+        _canon(a.get("city")),
+        _canon(a.get("local_area")),
+        _canon(a.get("country")),
+        str(int(a.get("_total_qty", 1) or 1)),
+        str(int(declared_value)),
+        day,
+    ])
+
+def qty_bucket(total_qty: int) -> str:
+    """
+    Bottle-count band used where an approximate price is good enough
+    (last-known-good estimates, rate cards): 1, 2-3, 4-6, 7-12, 13+.
+    """
+    q = max(1, int(total_qty or 1))
+    for upper, label in ((1, "1"), (3, "2-3"), (6, "4-6"), (12, "7-12")):
+        if q <= upper:
+            return label
+    return "13+"
+
+# Declared-value band tops in rands; carts above the last band get their own bucket.
+VALUE_BANDS = (1000, 2500, 5000)
+
+def value_bucket(declared_value_rands: int) -> str:
+    v = int(declared_value_rands or 0)
+    for upper in VALUE_BANDS:
+        if v <= upper:
+            return f"<={upper}"
+    return f">{VALUE_BANDS[-1]}"
+
+class RateCache:
+    """
+    Bounded LRU with a per-entry TTL, optionally backed by a SQLite file that
+    all workers share. Values must survive a JSON round trip for the shared
+    file; `decode` turns what comes back (lists for tuples) into the value
+    type again. Treat values as read-only.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: int = 21600, db_path: str = "", table: str = "rate_cache", decode=None):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = int(ttl)
+        self.db_path = db_path
+        self.table = table
+        self.decode = decode
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._ready = False
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # ---- shared backend ----
+
+    def _conn(self):
+        conn = db.connect(self.db_path)
+        if not self._ready:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_used ON {self.table}(used_at)")
+            self._ready = True
+        return conn
+
+    def _shared_get(self, key: str, now: float):
+        conn = self._conn()
+        row = conn.execute(
+            f"SELECT value, expires_at, used_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        value, expires_at, used_at = row
+        if expires_at <= now:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ? AND expires_at <= ?", (key, now))
+            return None
+        # Only touch the LRU clock once a minute so hot keys don't turn every hit into a write.
+        if now - used_at > 60:
+            conn.execute(f"UPDATE {self.table} SET used_at = ? WHERE key = ?", (now, key))
+        value = json.loads(value)
+        return expires_at, self.decode(value) if self.decode else value
+
+    def _shared_set(self, key: str, value, expires_at: float, now: float):
+        conn = self._conn()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), expires_at, now),
+        )
+        conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+        excess = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.maxsize
+        if excess > 0:
+            cur = conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN"
+                f" (SELECT key FROM {self.table} ORDER BY used_at LIMIT ?)",
+                (excess,),
+            )
+            with self._lock:
+                self.evictions += cur.rowcount
+
+    # ---- public API ----
+
+    def _put_local(self, key: str, expires_at: float, value):
+        # caller holds self._lock
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str, record: bool = True):
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._data.move_to_end(key)
+                    self.hits += record
+                    return item[1]
+                del self._data[key]
+                self.expirations += 1
+
+        if self.db_path:
+            try:
+                found = self._shared_get(key, now)
+            except Exception:
+                found = None  # a locked/corrupt cache file must never break quoting
+            if found is not None:
+                expires_at, value = found
+                with self._lock:
+                    self._put_local(key, expires_at, value)
+                    self.hits += record
+                    self.shared_hits += record
+                return value
+
+        with self._lock:
+            self.misses += record
+        return None
+
+    def set(self, key: str, value, ttl: int = None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else int(ttl))
+        with self._lock:
+            self._put_local(key, expires_at, value)
+        if self.db_path:
+            try:
+                self._shared_set(key, value, expires_at, now)
+            except Exception:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self.db_path:
+            self._conn().execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "shared": bool(self.db_path),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+def decode_quotes(value) -> tuple:
+    # imported here: the carrier adapters import this module
+    from services.carriers.base import RateQuote
+    if not isinstance(value, list) or not all(isinstance(q, list) for q in value):
+        raise ValueError("not a list of quotes")  # e.g. a raw answer an older release cached; a miss
+    return tuple(RateQuote._make(q) for q in value)
+
+# Shiplogic answers, parsed: a tuple of RateQuote per key.
+quote_cache = RateCache(maxsize=RATE_CACHE_SIZE, ttl=RATE_CACHE_TTL, db_path=RATE_CACHE_DB, decode=decode_quotes)
+
+metrics.register("rate_cache_hits_total", "counter", "Rate quote cache hits (in-process or shared).")
+metrics.register("rate_cache_misses_total", "counter", "Rate quote cache misses.")
+metrics.register("rate_cache_evictions_total", "counter", "Entries evicted to stay within RATE_CACHE_SIZE.")
+metrics.register_collector(lambda: [
+    ("rate_cache_hits_total", {}, quote_cache.hits),
+    ("rate_cache_misses_total", {}, quote_cache.misses),
+    ("rate_cache_evictions_total", {}, quote_cache.evictions),
+])
@@ -0,0 +1,182 @@
+"""
+Precomputed shipping prices: zone x bottle band x declared-value band.
+
+    python -m services.rate_card refresh    # rebuild now (cron, or Render job)
+
+With RATE_CARD_MODE=1 the quote button prices from this matrix in O(1) and
+only falls back to a live call for carts or addresses outside it. Each worker
+also runs a refresher thread; a file lock lets only one of them rebuild.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from services import db
+from services.rate_cache import VALUE_BANDS, qty_bucket
+from services.shiplogic_rates import get_rates, normalize_zone
+
+log = logging.getLogger(__name__)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RATE_CARD_MODE = os.getenv("RATE_CARD_MODE", "").strip().lower() in ("1", "true", "yes", "on")
+RATE_CARD_PATH = os.getenv("RATE_CARD_PATH", "").strip() or db.data_path("rate_card.json")
+RATE_CARD_ADDRESSES = os.getenv("RATE_CARD_ADDRESSES", "").strip() or os.path.join(_ROOT, "data", "rate_card_addresses.json")
+RATE_CARD_REFRESH_INTERVAL = int(os.getenv("RATE_CARD_REFRESH_INTERVAL", str(12 * 3600)))
+# A card older than this is ignored (live quotes instead).
+RATE_CARD_MAX_AGE = int(os.getenv("RATE_CARD_MAX_AGE", str(3 * 24 * 3600)))
+
+# band label -> bottles quoted for it (the top of the band, so the card never undercharges)
+QTY_BANDS = (("1", 1), ("2-3", 3), ("4-6", 6), ("7-12", 12))
+def value_band(declared_value_rands: int):
+    """
+    Upper bound of the declared-value band, or None if it's above the card.
+    """
+    for upper in VALUE_BANDS:
+        if declared_value_rands <= upper:
+            return upper
+    return None
+
+def cell_key(zone: str, total_qty: int, declared_value_rands: int):
+    band = value_band(declared_value_rands)
+    qty = qty_bucket(total_qty)
+    if band is None or qty not in dict(QTY_BANDS):
+        return None
+    return f"{normalize_zone(zone)}|{qty}|{band}"
+
+def _load_addresses() -> dict:
+    with open(RATE_CARD_ADDRESSES, encoding="utf-8-sig") as f:
+        return json.load(f)
+
+def build() -> dict:
+    """
+    Quotes every cell live (through get_rates, so the rate cache and breaker
+    apply) and returns the card. Cells that fail are left out.
+    """
+    cells = {}
+    failed = 0
+    for zone, addr in _load_addresses().items():
+        for label, qty in QTY_BANDS:
+            for band in VALUE_BANDS:
+                delivery_address = {
+                    "type": "residential",
+                    "company": "",
+                    "street_address": addr["street_address"],
+                    "local_area": addr["local_area"],
+                    "city": addr["city"],
+                    "zone": zone,
+                    "country": "ZA",
+                    "code": addr["code"],
+                    "_total_qty": qty,
+                }
+                try:
+                    rates = get_rates(delivery_address, declared_value=band)
+                except Exception as e:
+                    failed += 1
+                    log.warning("rate card cell %s|%s|%s failed: %s", zone, label, band, e)
+                    continue
+                if not rates:
+                    continue
+                best = min(rates, key=lambda q: q.fee_cents)
+                cells[f"{zone}|{label}|{band}"] = {"fee_cents": best.fee_cents, "service": best.service}
+    return {"generated_at": time.time(), "cells": cells, "failed": failed}
+
+def save(card: dict, path: str = None):
+    path = path or RATE_CARD_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(card, f)
+    os.replace(tmp, path)
+
+def refresh() -> dict:
+    card = build()
+    if card["cells"]:
+        save(card)
+    return card
+
+_card = None
+_card_mtime = None
+_lock = threading.Lock()
+
+def current():
+    """
+    The saved card, reloaded when the file changes; None if missing or stale.
+    """
+    global _card, _card_mtime
+    try:
+        mtime = os.stat(RATE_CARD_PATH).st_mtime_ns
+    except OSError:
+        return None
+    if mtime != _card_mtime:
+        with _lock:
+            if mtime != _card_mtime:
+                try:
+                    with open(RATE_CARD_PATH, encoding="utf-8") as f:
+                        _card = json.load(f)
+                except (OSError, ValueError):
+                    _card = None
+                _card_mtime = mtime
+    card = _card
+    if not card or time.time() - card.get("generated_at", 0) > RATE_CARD_MAX_AGE:
+        return None
+    return card
+
+def lookup(zone: str, total_qty: int, declared_value_rands: int):
+    """
+    {"fee_cents", "service"} for this cart, or None if it's outside the card.
+    """
+    key = cell_key(zone, total_qty, declared_value_rands)
+    card = current() if key else None
+    if card is None:
+        return None
+    return card["cells"].get(key)
+
+def _refresh_if_due():
+    card = current()
+    if card is not None and time.time() - card.get("generated_at", 0) < RATE_CARD_REFRESH_INTERVAL:
+        return
+    lock_dir = db.data_path("locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, "rate-card.lock"), "a") as fh:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # another worker is rebuilding
+        card = current()
+        if card is not None and time.time() - card.get("generated_at", 0) < RATE_CARD_REFRESH_INTERVAL:
+            return  # rebuilt while we waited for the lock
+        card = refresh()
+        log.info("rate card refreshed: %d cells, %d failed", len(card["cells"]), card["failed"])
+
+def _refresh_forever():
+    while True:
+        try:
+            _refresh_if_due()
+        except Exception:
+            log.exception("rate card refresh failed")
+        time.sleep(min(600, RATE_CARD_REFRESH_INTERVAL))
+
+def start_refresher():
+    """
+    Background rebuild every RATE_CARD_REFRESH_INTERVAL; one thread per worker.
+    """
+    if RATE_CARD_MODE:
+        db.start_once("rate-card", _refresh_forever)
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["refresh"]:
+        print(__doc__.strip())
+        sys.exit(2)
+    logging.basicConfig(level=logging.INFO)
+    card = refresh()
+    print(f"{len(card['cells'])} cells written to {RATE_CARD_PATH} ({card['failed']} failed)")
@@ -0,0 +1,229 @@
+import os
+import re
+import secrets
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+
+from services import db
+
+# memory  - per-process dict, for local development (one worker only)
+# sqlite  - shared file, safe across gunicorn workers (default)
+# cookie  - Flask's stock signed-cookie session
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite").strip().lower()
+SESSION_DB = os.getenv("SESSION_DB", "").strip() or db.data_path("sessions.sqlite3")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(14 * 24 * 3600)))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+
+_SID_RE = re.compile(r"^[A-Za-z0-9_-]{43}$")
+_serializer = TaggedJSONSerializer()
+
+def _new_sid() -> str:
+    return secrets.token_urlsafe(32)
+
+class MemoryStore:
+    def __init__(self):
+        self._data = {}  # sid -> (expires_at, payload)
+        self._lock = threading.Lock()
+
+    def load(self, sid: str):
+        with self._lock:
+            item = self._data.get(sid)
+        if item is None or item[0] <= time.time():
+            return None
+        return item[1], item[0]
+
+    def save(self, sid: str, payload: str, expires_at: float):
+        with self._lock:
+            self._data[sid] = (expires_at, payload)
+
+    def touch(self, sid: str, expires_at: float):
+        with self._lock:
+            item = self._data.get(sid)
+            if item is not None:
+                self._data[sid] = (expires_at, item[1])
+
+    def delete(self, sid: str):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def sweep(self) -> int:
+        now = time.time()
+        with self._lock:
+            dead = [sid for sid, (exp, _) in self._data.items() if exp <= now]
+            for sid in dead:
+                del self._data[sid]
+        return len(dead)
+
+class SQLiteStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._ready = False
+
+    def _conn(self):
+        conn = db.connect(self.path)
+        if not self._ready:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " sid TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions(expires_at)")
+            self._ready = True
+        return conn
+
+    def load(self, sid: str):
+        row = self._conn().execute(
+            "SELECT payload, expires_at FROM sessions WHERE sid = ? AND expires_at > ?",
+            (sid, time.time()),
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def save(self, sid: str, payload: str, expires_at: float):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (sid, payload, expires_at) VALUES (?, ?, ?)",
+            (sid, payload, expires_at),
+        )
+
+    def touch(self, sid: str, expires_at: float):
+        self._conn().execute("UPDATE sessions SET expires_at = ? WHERE sid = ?", (expires_at, sid))
+
+    def delete(self, sid: str):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def sweep(self) -> int:
+        return self._conn().execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+
+class ServerSession(SessionMixin):
+    """
+    Session whose data lives in a store; the cookie only carries the id.
+    Nothing is read until a route actually touches the session, and nothing
+    is written back unless it was modified.
+    """
+
+    def __init__(self, store, sid: str, new: bool):
+        self.store = store
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self.expires_at = 0.0
+        self._data = {} if new else None
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    def _load(self) -> dict:
+        self.accessed = True
+        if self._data is None:
+            found = self.store.load(self.sid)
+            if found is None:
+                # unknown or expired id: start over under a fresh one
+                self.sid = _new_sid()
+                self.new = True
+                self._data = {}
+            else:
+                payload, self.expires_at = found
+                self._data = _serializer.loads(payload)
+        return self._data
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def clear(self):
+        self._load().clear()
+        self.modified = True
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store, ttl: int = SESSION_TTL, sweep_interval: int = SESSION_SWEEP_INTERVAL):
+        self.store = store
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+
+    def _start_sweeper(self):
+        # one daemon thread per worker process, started on first use (after fork)
+        if self.sweep_interval > 0:
+            db.start_once("session-sweeper", self._sweep_forever)
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.store.sweep()
+            except Exception:
+                pass
+
+    def open_session(self, app, request):
+        self._start_sweeper()
+        sid = request.cookies.get(self.get_cookie_name(app), "")
+        if _SID_RE.match(sid):
+            return ServerSession(self.store, sid, new=False)
+        return ServerSession(self.store, _new_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session.loaded:
+            return  # untouched this request: no read, no write, no cookie
+
+        now = time.time()
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure, samesite=samesite, httponly=httponly)
+            return
+
+        if session.modified:
+            self.store.save(session.sid, _serializer.dumps(dict(session)), now + self.ttl)
+        elif session.expires_at - now < self.ttl - 3600:
+            # sliding expiry, but at most one touch per hour per session
+            self.store.touch(session.sid, now + self.ttl)
+
+        if session.new or (session.permanent and self.should_set_cookie(app, session)):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=httponly,
+                domain=domain,
+                path=path,
+                secure=secure,
+                samesite=samesite,
+            )
+            response.vary.add("Cookie")
+
+def make_session_interface():
+    """
+    Session interface for SESSION_BACKEND, or None to keep Flask's cookie sessions.
+    """
+    if SESSION_BACKEND == "cookie":
+        return None
+    if SESSION_BACKEND == "memory":
+        return ServerSessionInterface(MemoryStore())
+    if SESSION_BACKEND == "sqlite":
+        return ServerSessionInterface(SQLiteStore(SESSION_DB))
+    raise RuntimeError(f"Unknown SESSION_BACKEND '{SESSION_BACKEND}' (use sqlite, memory or cookie).")
@@ -0,0 +1,230 @@
+"""
+Deployment settings (keys, upstream URLs, store address, parcel size),
+parsed and validated once into a frozen Settings object.
+
+    from services import settings
+    settings.current().shiplogic_api_key
+
+load() runs at import, so a worker with bad settings fails to boot instead
+of failing on the first quote. It also copies a .env file next to app.py
+into os.environ (real environment variables win), so import this before
+modules that read os.getenv at import. On SIGHUP the .env file is read
+again, and its values win. Under
+gunicorn that happens in the master (see gunicorn.conf.py on_reload) before
+it replaces the workers; under `python app.py` install_sighup() swaps the
+object in place and tells listeners. A reload that doesn't validate is
+logged and ignored, and the running settings stay.
+
+Tuning knobs (cache sizes, timeouts) stay as module constants in their own
+modules; they have safe defaults and nothing to cross-check.
+"""
+import logging
+import os
+import signal
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from urllib.parse import urlsplit
+
+try:
+    from dotenv import dotenv_values
+except ImportError:
+    dotenv_values = None
+
+log = logging.getLogger(__name__)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV_FILE = os.path.join(_ROOT, ".env")
+
+DEFAULT_SECRET_KEY = "dev-secret-change-me"
+DEFAULT_ADMIN_KEY = "1234"
+
+class ConfigError(RuntimeError):
+    pass
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    secret_key: str
+    admin_key: str
+    whatsapp_number: str
+    public_url: str
+    yoco_secret_key: str
+    yoco_webhook_secret: str  # signs Yoco's payment webhooks; "" = payments are never confirmed
+    low_stock: int
+
+    shiplogic_api_key: str
+    shiplogic_rates_url: str
+    shiplogic_from: MappingProxyType  # collection address sent to Shiplogic
+
+    courier_guy_api_key: str
+    courier_guy_rates_url: str
+    courier_guy_from: MappingProxyType  # collection address sent to PUDO
+
+    parcel_cm: tuple  # (length, width, height) of the box
+    kg_per_bottle: float
+
+    order_webhook_url: str  # "" = order events are only logged
+    order_webhook_concurrency: int
+
+def _address(env: dict, prefix: str) -> MappingProxyType:
+    return MappingProxyType({
+        "type": env.get(f"{prefix}_TYPE", "business").strip(),
+        "company": env.get(f"{prefix}_COMPANY", "First Pour").strip(),
+        "street_address": env.get(f"{prefix}_STREET", "").strip(),
+        "local_area": env.get(f"{prefix}_LOCAL_AREA", "").strip(),
+        "city": env.get(f"{prefix}_CITY", "").strip(),
+        "zone": env.get(f"{prefix}_ZONE", "Gauteng").strip(),  # must be province name
+        "country": env.get(f"{prefix}_COUNTRY", "ZA").strip(),
+        "code": env.get(f"{prefix}_CODE", "").strip(),
+    })
+
+def from_env(env) -> Settings:
+    """
+    Builds Settings from a mapping of environment variables; raises
+    ConfigError listing every problem at once.
+    """
+    problems = []
+
+    def number(name: str, default: str, cast=float):
+        raw = (env.get(name) or default).strip()
+        try:
+            value = cast(raw)
+        except ValueError:
+            problems.append(f"{name}={raw!r} is not a number")
+            return cast(default)
+        if value <= 0:
+            problems.append(f"{name} must be positive")
+        return value
+
+    def url(name: str, default: str) -> str:
+        value = (env.get(name) or default).strip()
+        if not value.startswith(("http://", "https://")):
+            problems.append(f"{name}={value!r} is not an http(s) URL")
+        return value
+
+    shiplogic_key = (env.get("SHIPLOGIC_API_KEY") or env.get("TCG_API_KEY") or "").strip()
+    shiplogic_from = _address(env, "SL_FROM")
+    if shiplogic_key:
+        for k in ("street_address", "city", "zone", "code"):
+            if not shiplogic_from[k]:
+                problems.append(f"Store (collection) address missing '{k}' for Shiplogic. Set SL_FROM_* env vars on Render.")
+
+    courier_guy_key = env.get("COURIERGUY_API_KEY", "").strip()
+    courier_guy_from = _address(env, "CG_FROM")
+    if courier_guy_key:
+        for k in ("street_address", "city", "code"):
+            if not courier_guy_from[k]:
+                problems.append(f"Store (collection) address missing '{k}' for Courier Guy. Set CG_FROM_* env vars on Render.")
+
+    whatsapp = env.get("WHATSAPP_NUMBER", "27645277314").strip()
+    if not whatsapp.isdigit():
+        problems.append(f"WHATSAPP_NUMBER={whatsapp!r} must be digits only (international format, no +)")
+
+    # order data (names, phone numbers) only goes out encrypted; plain http is for local stubs
+    webhook = env.get("ORDER_WEBHOOK_URL", "").strip()
+    if webhook:
+        parts = urlsplit(webhook)
+        local = parts.scheme == "http" and parts.hostname in ("localhost", "127.0.0.1", "::1")
+        if not parts.netloc or not (parts.scheme == "https" or local):
+            problems.append(f"ORDER_WEBHOOK_URL={webhook!r} must be an absolute https:// URL")
+
+    yoco_key = env.get("YOCO_SECRET_KEY", "").strip()
+    if yoco_key and not yoco_key.startswith("sk_"):
+        problems.append("YOCO_SECRET_KEY should be a secret key (sk_live_... or sk_test_...)")
+    yoco_webhook_secret = env.get("YOCO_WEBHOOK_SECRET", "").strip()
+    if yoco_webhook_secret and not yoco_webhook_secret.startswith("whsec_"):
+        problems.append("YOCO_WEBHOOK_SECRET should be the whsec_... secret Yoco returned when the webhook was registered")
+
+    s = Settings(
+        secret_key=env.get("FLASK_SECRET_KEY") or env.get("SECRET_KEY") or DEFAULT_SECRET_KEY,
+        admin_key=env.get("ADMIN_KEY", DEFAULT_ADMIN_KEY),
+        whatsapp_number=whatsapp,
+        public_url=url("PUBLIC_URL", "http://127.0.0.1:5000").rstrip("/"),
+        yoco_secret_key=yoco_key,
+        yoco_webhook_secret=yoco_webhook_secret,
+        low_stock=number("LOW_STOCK", "10", int),
+        shiplogic_api_key=shiplogic_key,
+        shiplogic_rates_url=url("SHIPLOGIC_RATES_URL", "https://api.shiplogic.com/rates"),
+        shiplogic_from=shiplogic_from,
+        courier_guy_api_key=courier_guy_key,
+        courier_guy_rates_url=url("COURIERGUY_RATES_URL", "https://api-pudo.co.za/rates"),
+        courier_guy_from=courier_guy_from,
+        parcel_cm=(number("SL_PARCEL_LEN_CM", "35"), number("SL_PARCEL_W_CM", "25"), number("SL_PARCEL_H_CM", "15")),
+        kg_per_bottle=number("PARCEL_KG_PER_BOTTLE", "1.5"),
+        order_webhook_url=webhook,
+        order_webhook_concurrency=number("ORDER_WEBHOOK_CONCURRENCY", "2", int),
+    )
+    if problems:
+        raise ConfigError("Invalid configuration:\n  - " + "\n  - ".join(problems))
+    return s
+
+def _env_file(env_file: str) -> dict:
+    if dotenv_values is None or not os.path.exists(env_file):
+        return {}
+    return {k: v for k, v in dotenv_values(env_file).items() if v is not None}
+
+def _warn(s: Settings):
+    if s.public_url.startswith("https://"):
+        if s.secret_key == DEFAULT_SECRET_KEY:
+            log.warning("FLASK_SECRET_KEY is not set; sessions are signed with the development key")
+        if s.admin_key == DEFAULT_ADMIN_KEY:
+            log.warning("ADMIN_KEY is the default; set it on Render")
+    if s.yoco_secret_key and not s.yoco_webhook_secret:
+        log.warning("YOCO_WEBHOOK_SECRET is not set; Yoco payments won't be confirmed, so stock held for them expires unsold")
+
+_current = None
+_listeners = []
+_lock = threading.Lock()
+
+def load(env_file: str = ENV_FILE) -> Settings:
+    global _current
+    for k, v in _env_file(env_file).items():
+        os.environ.setdefault(k, v)
+    s = from_env(os.environ)
+    _warn(s)
+    _current = s
+    return s
+
+def current() -> Settings:
+    s = _current
+    return s if s is not None else load()
+
+def on_reload(fn):
+    """
+    Registers fn(settings) to run after an in-process reload.
+    """
+    _listeners.append(fn)
+    return fn
+
+def reload(env_file: str = ENV_FILE) -> bool:
+    """
+    Re-reads the .env file into os.environ and rebuilds the settings.
+    Returns False (keeping everything as it was) if they don't validate.
+    """
+    global _current
+    with _lock:
+        fresh = _env_file(env_file)
+        env = dict(os.environ)
+        env.update(fresh)
+        try:
+            s = from_env(env)
+        except ConfigError as e:
+            log.error("settings reload ignored: %s", e)
+            return False
+        os.environ.update(fresh)
+        _current = s
+        _warn(s)
+    for fn in _listeners:
+        fn(s)
+    log.info("settings reloaded")
+    return True
+
+def install_sighup():
+    """
+    Reloads on SIGHUP. Only for processes that own their signals (the dev
+    server); gunicorn workers are replaced by the master instead.
+    """
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload())
+
+load()
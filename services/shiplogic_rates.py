@@ -1,8 +1,26 @@
 ﻿import os
 import datetime as _dt
-import requests
+from services import db, http_client, settings
+from services.carriers.base import parse_rates
+from services.circuit_breaker import CircuitBreaker
+from services.rate_cache import RATE_CACHE_DB, RateCache, decode_quotes, cache_key, qty_bucket, quote_cache
+from services.single_flight import SingleFlight
 
-SHIPLOGIC_RATES_URL = os.getenv("SHIPLOGIC_RATES_URL", "https://api.shiplogic.com/rates").strip()
+# How long a last-known-good answer may stand in as an estimate during an outage.
+RATE_LKG_TTL = int(os.getenv("RATE_LKG_TTL", str(7 * 24 * 3600)))
+
+# Identical quotes in flight at the same moment share one POST. Across workers
+# too when the rate cache is shared, since that's where followers find the answer.
+_flight = SingleFlight("shiplogic-rates", lock_dir=db.data_path("locks") if quote_cache.db_path else "")
+
+# Fails fast while Shiplogic is down instead of every quote waiting out the timeout.
+breaker = CircuitBreaker("shiplogic")
+
+# Last good answer per zone and bottle-count band, for estimates while the circuit is open.
+last_good = RateCache(maxsize=256, ttl=RATE_LKG_TTL, db_path=RATE_CACHE_DB, table="rate_last_good", decode=decode_quotes)
+
+class UpstreamError(Exception):
+    pass
 
 def normalize_zone(province_or_code: str) -> str:
     """
@@ -34,40 +52,36 @@ def normalize_zone(province_or_code: str) -> str:
 def _today() -> str:
     return _dt.date.today().strftime("%Y-%m-%d")
 
-def _collection_address_from_env() -> dict:
-    """
-    Your store/warehouse address (collection point).
-    Set these on Render.
-    """
-    return {
-        "type": os.getenv("SL_FROM_TYPE", "business"),
-        "company": os.getenv("SL_FROM_COMPANY", "First Pour"),
-        "street_address": os.getenv("SL_FROM_STREET", "").strip(),
-        "local_area": os.getenv("SL_FROM_LOCAL_AREA", "").strip(),
-        "city": os.getenv("SL_FROM_CITY", "").strip(),
-        "zone": os.getenv("SL_FROM_ZONE", "Gauteng").strip(),  # must be province name
-        "country": os.getenv("SL_FROM_COUNTRY", "ZA").strip(),
-        "code": os.getenv("SL_FROM_CODE", "").strip(),
-    }
-
 def _parcels_default(total_qty: int) -> list:
     """
     Safe default packaging assumptions (you can refine later).
     """
+    cfg = settings.current()
     if total_qty <= 0:
         total_qty = 1
 
-    # estimate 1.5kg per bottle
-    weight = max(1.0, total_qty * 1.5)
+    weight = max(1.0, total_qty * cfg.kg_per_bottle)
+    length, width, height = cfg.parcel_cm
 
     return [{
-        "submitted_length_cm": float(os.getenv("SL_PARCEL_LEN_CM", "35")),
-        "submitted_width_cm": float(os.getenv("SL_PARCEL_W_CM", "25")),
-        "submitted_height_cm": float(os.getenv("SL_PARCEL_H_CM", "15")),
+        "submitted_length_cm": length,
+        "submitted_width_cm": width,
+        "submitted_height_cm": height,
         "submitted_weight_kg": float(weight),
     }]
 
-def get_rates(delivery_address: dict, declared_value: int = 1500) -> dict:
+def api_key() -> str:
+    return settings.current().shiplogic_api_key
+
+def parse(data) -> tuple:
+    """
+    RateQuotes from a Shiplogic answer. "rate" (rands, VAT inclusive) and
+    "service_level" are the documented fields; the older names in
+    carriers.base.PRICE_KEYS / LIST_KEYS are still accepted.
+    """
+    return tuple(parse_rates("shiplogic", data, "Courier"))
+
+def get_rates(delivery_address: dict, declared_value: int = 1500) -> tuple:
     """
     Calls Shiplogic:
       POST https://api.shiplogic.com/rates
@@ -75,24 +89,35 @@ def get_rates(delivery_address: dict, declared_value: int = 1500) -> dict:
 
     Env:
       SHIPLOGIC_API_KEY  (or TCG_API_KEY if that’s what you used)
-    """
-    api_key = (os.getenv("SHIPLOGIC_API_KEY") or os.getenv("TCG_API_KEY") or "").strip()
-    if not api_key:
-        raise Exception("Missing Shiplogic API key. Set SHIPLOGIC_API_KEY on Render (or TCG_API_KEY).")
-
-    collection_address = _collection_address_from_env()
 
-    # Validate collection address (prevents 404/no routes)
-    required = ["street_address", "city", "zone", "code"]
-    for k in required:
-        if not collection_address.get(k):
-            raise Exception(f"Store (collection) address missing '{k}'. Set SL_FROM_* env vars on Render.")
+    Returns the answer parsed into RateQuotes. Those are cached per
+    destination / bottle count / declared value (see services/rate_cache.py),
+    so repeat quotes skip the round trip and the parse, and identical quotes
+    already in flight wait for that one call.
+    """
+    key = cache_key(delivery_address, declared_value, _today())
+    cached = quote_cache.get(key)
+    if cached is not None:
+        delivery_address.pop("_total_qty", None)
+        return cached
 
     # Count total qty from cart lines if present in delivery_address metadata
     total_qty = int(delivery_address.pop("_total_qty", 1))
 
+    return _flight.do(
+        key,
+        lambda: _fetch_rates(key, delivery_address, total_qty, declared_value),
+        recheck=lambda: quote_cache.get(key, record=False),
+    )
+
+def _fetch_rates(key: str, delivery_address: dict, total_qty: int, declared_value: int) -> tuple:
+    token = api_key()
+    if not token:
+        raise Exception("Missing Shiplogic API key. Set SHIPLOGIC_API_KEY on Render (or TCG_API_KEY).")
+
+    # the collection address was validated when settings loaded
     payload = {
-        "collection_address": collection_address,
+        "collection_address": dict(settings.current().shiplogic_from),
         "delivery_address": delivery_address,
         "parcels": _parcels_default(total_qty),
         "declared_value": int(declared_value),
@@ -101,12 +126,33 @@ def get_rates(delivery_address: dict, declared_value: int = 1500) -> dict:
     }
 
     headers = {
-        "Authorization": f"Bearer {api_key}",
+        "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
     }
 
-    r = requests.post(SHIPLOGIC_RATES_URL, json=payload, headers=headers, timeout=30)
+    r = breaker.call(_post_rates, payload, headers)
     if r.status_code not in (200, 201):
         raise Exception(f"Shiplogic rates failed ({r.status_code}): {r.text}")
 
-    return r.json()
+    quotes = parse(r.json())
+    quote_cache.set(key, quotes)
+    last_good.set(_last_good_key(delivery_address.get("zone"), total_qty), quotes)
+    return quotes
+
+def _post_rates(payload: dict, headers: dict):
+    # A rates lookup has no side effects, so the client may retry it.
+    r = http_client.post(settings.current().shiplogic_rates_url, json=payload, headers=headers, upstream="shiplogic", idempotent=True)
+    if r.status_code >= 500 or r.status_code == 429:
+        # only upstream trouble counts against the breaker; a 4xx is about our request
+        raise UpstreamError(f"Shiplogic rates failed ({r.status_code}): {r.text}")
+    return r
+
+def _last_good_key(zone: str, total_qty: int) -> str:
+    return f"{normalize_zone(zone or '').lower()}|{qty_bucket(total_qty)}"
+
+def last_good_rates(zone: str, total_qty: int):
+    """
+    RateQuotes of the most recent live answer for this zone and bottle
+    band, or None.
+    """
+    return last_good.get(_last_good_key(zone, total_qty))
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: thread-level coalescing only
+    fcntl = None
+
+from services import metrics
+
+metrics.register("single_flight_calls_total", "counter", "Coalesced calls, by role (leader runs it, follower waits).")
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one. Threads in this
+    process wait on the leader's Event; with lock_dir set, leaders in other
+    workers also serialise on a striped flock, and `recheck` lets a late
+    leader pick up what the first one stored in a shared cache.
+    """
+
+    def __init__(self, name: str, lock_dir: str = "", stripes: int = 128, lock_wait: float = 10.0):
+        self.name = name
+        self.lock_dir = lock_dir if fcntl is not None else ""
+        self.stripes = stripes
+        self.lock_wait = lock_wait
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, recheck=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.inc("single_flight_calls_total", flight=self.name, role="follower")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.inc("single_flight_calls_total", flight=self.name, role="leader")
+        try:
+            call.result = self._run_locked(key, fn, recheck) if self.lock_dir else fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _run_locked(self, key: str, fn, recheck):
+        stripe = int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:8], 16) % self.stripes
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with open(os.path.join(self.lock_dir, f"{self.name}-{stripe}.lock"), "a") as fh:
+            deadline = time.monotonic() + self.lock_wait
+            locked = False
+            while True:
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        break  # holder is stuck; go it alone rather than wait forever
+                    time.sleep(0.02)
+            try:
+                if recheck is not None:
+                    found = recheck()
+                    if found is not None:
+                        return found
+                return fn()
+            finally:
+                if locked:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
@@ -0,0 +1,226 @@
+"""
+Durable background tasks in SQLite, run by a separate worker process.
+
+    @tasks.task("notify_order_paid", concurrency=2)
+    def notify_order_paid(payload): ...
+
+    tasks.enqueue("notify_order_paid", {"order_id": ...}, key=order_id)
+
+enqueue() is one small INSERT, so a request that hands work off answers in
+milliseconds however slow the service behind the task is. `python worker.py`
+(the Procfile's worker line) claims due tasks and runs them.
+
+Delivery is at least once. A claimed task holds a lease of its handler's
+`timeout`; if the worker dies or overruns, the lease lapses and the task is
+claimed again, so handlers must be safe to repeat. A handler that raises is
+retried with exponential backoff (TASK_BACKOFF_BASE doubling, capped at
+TASK_BACKOFF_MAX, with jitter) until `max_attempts`, then parked as "dead"
+for a look in /admin. `concurrency` caps how many of one task type run at
+once across every worker process, since the count is taken from the table.
+"""
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+from typing import Callable, NamedTuple
+
+from services import db, metrics
+
+log = logging.getLogger(__name__)
+
+TASKS_DB = os.getenv("TASKS_DB", "").strip() or db.data_path("tasks.sqlite3")
+# How long an idle worker thread waits before looking for due tasks again.
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", "1"))
+TASK_BACKOFF_BASE = float(os.getenv("TASK_BACKOFF_BASE", "5"))
+TASK_BACKOFF_MAX = float(os.getenv("TASK_BACKOFF_MAX", "3600"))
+# Finished tasks are deleted after this long; dead ones are kept.
+TASK_KEEP_DONE = float(os.getenv("TASK_KEEP_DONE", str(7 * 24 * 3600)))
+
+TASK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+metrics.register("tasks_enqueued_total", "counter", "Background tasks queued, by task.")
+metrics.register("tasks_finished_total", "counter", "Background task attempts, by task and outcome (done, retry, dead).")
+metrics.register("task_duration_seconds", "histogram", "Background task run time, by task.")
+
+class Handler(NamedTuple):
+    fn: Callable
+    concurrency: int
+    max_attempts: int
+    timeout: float
+
+HANDLERS = {}
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS tasks ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, payload TEXT NOT NULL,"
+    " key TEXT UNIQUE, status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0,"
+    " run_at REAL NOT NULL, locked_until REAL, locked_by TEXT, last_error TEXT,"
+    " created_at REAL NOT NULL, finished_at REAL)",
+    "CREATE INDEX IF NOT EXISTS tasks_due ON tasks (status, name, run_at)",
+)
+
+def task(name: str, *, concurrency: int = 1, max_attempts: int = 8, timeout: float = 120):
+    """
+    Registers fn(payload) as the handler for task `name`.
+    """
+    def deco(fn):
+        HANDLERS[name] = Handler(fn, max(1, concurrency), max(1, max_attempts), timeout)
+        return fn
+    return deco
+
+def _conn():
+    return db.connect(TASKS_DB, SCHEMA)
+
+def enqueue(name: str, payload: dict = None, *, key: str = None, delay: float = 0) -> bool:
+    """
+    Queues task `name`. With `key`, a task already queued under the same key
+    is kept instead (a reloaded success page doesn't notify twice). Returns
+    False when the key was taken.
+    """
+    now = time.time()
+    cur = _conn().execute(
+        "INSERT OR IGNORE INTO tasks (name, payload, key, run_at, created_at) VALUES (?, ?, ?, ?, ?)",
+        (name, json.dumps(payload or {}, separators=(",", ":")), key, now + delay, now),
+    )
+    if cur.rowcount:
+        metrics.inc("tasks_enqueued_total", task=name)
+    return bool(cur.rowcount)
+
+def backoff(attempts: int) -> float:
+    delay = min(TASK_BACKOFF_MAX, TASK_BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+def claim(name: str, worker: str):
+    """
+    Takes the oldest due task of type `name` (queued, or running with a lapsed
+    lease) unless `concurrency` of them are already running. Returns
+    (id, payload, attempts) or None.
+    """
+    handler = HANDLERS[name]
+    now = time.time()
+    with db.transaction(_conn()) as conn:
+        (running,) = conn.execute(
+            "SELECT COUNT(*) FROM tasks WHERE name = ? AND status = 'running' AND locked_until > ?", (name, now)
+        ).fetchone()
+        if running >= handler.concurrency:
+            return None
+        row = conn.execute(
+            "SELECT id, payload, attempts FROM tasks WHERE name = ? AND"
+            " ((status = 'queued' AND run_at <= ?) OR (status = 'running' AND locked_until <= ?))"
+            " ORDER BY run_at, id LIMIT 1",
+            (name, now, now),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE tasks SET status = 'running', attempts = attempts + 1, locked_until = ?, locked_by = ? WHERE id = ?",
+            (now + handler.timeout, worker, row[0]),
+        )
+    return row[0], json.loads(row[1]), row[2] + 1
+
+def _finish(task_id: int, worker: str, sql: str, params: tuple):
+    # only the current lease holder may settle a task; a lapsed one was re-claimed
+    _conn().execute(sql + " WHERE id = ? AND status = 'running' AND locked_by = ?", params + (task_id, worker))
+
+def run_one(name: str, worker: str) -> bool:
+    """
+    Claims and runs one task of type `name`. Returns False if none was due.
+    """
+    claimed = claim(name, worker)
+    if claimed is None:
+        return False
+    task_id, payload, attempts = claimed
+    handler = HANDLERS[name]
+    start = time.perf_counter()
+    try:
+        handler.fn(payload)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}"[:4000]
+        if attempts >= handler.max_attempts:
+            log.error("task %s #%d dead after %d attempts: %s", name, task_id, attempts, e)
+            _finish(task_id, worker, "UPDATE tasks SET status = 'dead', last_error = ?, finished_at = ?", (error, time.time()))
+            outcome = "dead"
+        else:
+            log.warning("task %s #%d failed (attempt %d): %s", name, task_id, attempts, e)
+            _finish(task_id, worker, "UPDATE tasks SET status = 'queued', last_error = ?, run_at = ?",
+                    (error, time.time() + backoff(attempts)))
+            outcome = "retry"
+    else:
+        _finish(task_id, worker, "UPDATE tasks SET status = 'done', finished_at = ?", (time.time(),))
+        outcome = "done"
+    metrics.observe("task_duration_seconds", time.perf_counter() - start, buckets=TASK_BUCKETS, task=name)
+    metrics.inc("tasks_finished_total", task=name, outcome=outcome)
+    return True
+
+def purge(now: float = None) -> int:
+    """
+    Deletes finished tasks older than TASK_KEEP_DONE.
+    """
+    now = time.time() if now is None else now
+    return _conn().execute(
+        "DELETE FROM tasks WHERE status = 'done' AND finished_at < ?", (now - TASK_KEEP_DONE,)
+    ).rowcount
+
+def stats() -> dict:
+    """
+    Task counts by name and status, plus the newest dead tasks.
+    """
+    conn = _conn()
+    counts = {}
+    for name, status, n in conn.execute("SELECT name, status, COUNT(*) FROM tasks GROUP BY name, status"):
+        counts.setdefault(name, {})[status] = n
+    dead = [
+        {"id": i, "task": name, "attempts": attempts, "error": (err or "").splitlines()[0] if err else ""}
+        for i, name, attempts, err in conn.execute(
+            "SELECT id, name, attempts, last_error FROM tasks WHERE status = 'dead' ORDER BY id DESC LIMIT 20"
+        )
+    ]
+    return {"counts": counts, "dead": dead}
+
+def _loop(name: str, worker: str, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            if run_one(name, worker):
+                continue
+        except Exception:
+            log.exception("task loop %s", name)
+        stop.wait(TASK_POLL_INTERVAL)
+
+def run_worker(stop: threading.Event = None):
+    """
+    Runs every registered task type until SIGTERM/SIGINT (or `stop`): one
+    thread per unit of concurrency. Tasks in flight finish before it returns.
+    """
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda signum, frame: stop.set())
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    metrics.start_flusher()
+    threads = [
+        threading.Thread(target=_loop, args=(name, worker, stop), name=f"task-{name}-{i}")
+        for name, handler in HANDLERS.items()
+        for i in range(handler.concurrency)
+    ]
+    for t in threads:
+        t.start()
+    log.info("task worker %s running %s", worker, {n: h.concurrency for n, h in HANDLERS.items()})
+    # sleep rather than stop.wait(): setting an Event from a signal handler
+    # can deadlock against a wait in the same (main) thread
+    next_purge = 0.0
+    while not stop.is_set():
+        if time.monotonic() >= next_purge:
+            next_purge = time.monotonic() + 3600
+            try:
+                purge()
+            except Exception:
+                log.exception("task purge")
+        time.sleep(0.5)
+    for t in threads:
+        t.join()
+    metrics.flush()
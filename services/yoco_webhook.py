@@ -0,0 +1,46 @@
+"""
+Checks the signature on Yoco webhook calls.
+
+The browser coming back to /payment/success proves nothing: anyone can open
+that URL. Yoco's payment.succeeded webhook is the signal that money was
+taken. Register PUBLIC_URL/payment/webhook with Yoco (POST /api/webhooks)
+and put the secret it returns (whsec_...) in YOCO_WEBHOOK_SECRET.
+
+Yoco signs webhooks the Standard Webhooks way: an HMAC-SHA256 of
+"<webhook-id>.<webhook-timestamp>.<raw body>" keyed with the base64 part of
+the secret, sent as "v1,<base64 signature>" in webhook-signature.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import time
+
+# Calls stamped further from our clock than this are refused, so a captured
+# call can't be replayed later.
+TOLERANCE = 180
+
+def sign(secret: str, msg_id: str, timestamp: str, body: bytes) -> str:
+    key = base64.b64decode(secret.removeprefix("whsec_"))
+    signed = msg_id.encode("utf-8") + b"." + timestamp.encode("utf-8") + b"." + body
+    return base64.b64encode(hmac.new(key, signed, hashlib.sha256).digest()).decode("ascii")
+
+def verify(secret: str, headers, body: bytes, now: float = None) -> bool:
+    """
+    True if `body` carries a valid, recent signature for `secret`.
+    """
+    msg_id = headers.get("webhook-id", "")
+    timestamp = headers.get("webhook-timestamp", "")
+    if not secret or not msg_id or not timestamp.isdigit():
+        return False
+    if abs((time.time() if now is None else now) - int(timestamp)) > TOLERANCE:
+        return False
+    try:
+        expected = sign(secret, msg_id, timestamp, body)
+    except (binascii.Error, ValueError):
+        return False
+    for candidate in headers.get("webhook-signature", "").split():
+        version, _, signature = candidate.partition(",")
+        if version == "v1" and hmac.compare_digest(signature, expected):
+            return True
+    return False
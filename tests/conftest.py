@@ -0,0 +1,32 @@
+import os
+import tempfile
+import threading
+
+# before any service module reads it: keep the SQLite files, metrics and
+# sessions that importing app.py sets up out of ./instance
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="firstpour-tests-"))
+
+import pytest  # noqa: E402
+
+@pytest.fixture
+def race():
+    """
+    race(fn, n) starts n calls of fn() together, each on its own thread (and
+    so its own SQLite connection, as separate workers would have), and
+    returns their results.
+    """
+    def run_all(fn, n=8):
+        barrier = threading.Barrier(n)
+        results = [None] * n
+
+        def run(i):
+            barrier.wait()
+            results[i] = fn()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+    return run_all
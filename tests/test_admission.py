@@ -0,0 +1,57 @@
+import pytest
+from flask import Flask, g
+
+from services import admission
+
+app = Flask(__name__)
+
+@pytest.fixture(autouse=True)
+def limits(tmp_path, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_DB", str(tmp_path / "admission.sqlite3"))
+    monkeypatch.setattr(admission, "LIMITS", {"quote": admission.Limit(2, 60, "carrier")})
+    monkeypatch.setattr(admission, "UPSTREAM_CONCURRENCY", {"carrier": 1})
+
+def _admit(ip="10.0.0.1", **headers):
+    with app.test_request_context("/", environ_base={"REMOTE_ADDR": ip}, headers=headers):
+        rejection = admission.admit("quote")
+        admission.release()
+        return rejection
+
+def test_bucket_allows_the_burst_then_refuses():
+    assert _admit() is None
+    assert _admit() is None
+    rejection = _admit()
+    assert rejection.reason == "rate"
+    assert 0 < rejection.retry_after <= 30
+    assert _admit(ip="10.0.0.2") is None  # another client has its own bucket
+
+def test_routes_without_a_limit_are_always_admitted():
+    with app.test_request_context("/"):
+        assert all(admission.admit("index") is None for _ in range(10))
+
+def test_upstream_cap_turns_away_requests_in_flight():
+    with app.test_request_context("/", environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+        assert admission.admit("quote") is None
+        assert g.admission_slot
+        with app.test_request_context("/", environ_base={"REMOTE_ADDR": "10.0.0.2"}):
+            assert admission.admit("quote").reason == "busy"
+        admission.release()
+    assert _admit(ip="10.0.0.3") is None
+
+def test_abandoned_slot_frees_itself(monkeypatch):
+    monkeypatch.setattr(admission, "SLOT_LEASE", -1)
+    with app.test_request_context("/", environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+        assert admission.admit("quote") is None  # never released, as if the worker died
+    assert _admit(ip="10.0.0.2") is None
+
+def test_client_ip_counts_trusted_hops_from_the_right(monkeypatch):
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", 1)
+    with app.test_request_context("/", environ_base={"REMOTE_ADDR": "10.9.9.9"},
+                                  headers={"X-Forwarded-For": "6.6.6.6, 1.2.3.4"}):
+        assert admission.client_ip() == "1.2.3.4"
+
+def test_forwarded_for_is_ignored_without_trusted_proxies():
+    assert admission.TRUSTED_PROXIES == 0
+    for spoofed in ("1.1.1.1", "2.2.2.2", "3.3.3.3"):
+        _admit(ip="10.0.0.1", **{"X-Forwarded-For": spoofed})
+    assert _admit(ip="10.0.0.1", **{"X-Forwarded-For": "4.4.4.4"}).reason == "rate"
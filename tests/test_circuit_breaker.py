@@ -0,0 +1,40 @@
+import pytest
+
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+def _fail():
+    raise OSError("upstream down")
+
+def _trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(OSError):
+            breaker.call(_fail)
+
+def test_opens_after_failures_in_a_row_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=60)
+    _trip(breaker)
+    assert breaker.state == OPEN
+    calls = []
+    with pytest.raises(CircuitOpen):
+        breaker.call(calls.append, 1)
+    assert calls == []
+
+def test_a_success_resets_the_count():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=60)
+    with pytest.raises(OSError):
+        breaker.call(_fail)
+    breaker.call(lambda: None)
+    with pytest.raises(OSError):
+        breaker.call(_fail)
+    assert breaker.state == CLOSED
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0, half_open_max=1)
+    _trip(breaker)
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(OSError):
+        breaker.call(_fail)  # the probe fails: open again
+    assert breaker.allow() is True  # recovery_timeout=0, so the next probe is let through
+    assert breaker.allow() is False  # but only one at a time
+    breaker.record_success()
+    assert breaker.state == CLOSED
@@ -0,0 +1,52 @@
+import pytest
+
+from services import inventory
+
+@pytest.fixture
+def stock(tmp_path, monkeypatch):
+    monkeypatch.setattr(inventory, "INVENTORY_DB", str(tmp_path / "inventory.sqlite3"))
+    monkeypatch.setattr(inventory, "sync", lambda snap=None: None)  # seeded below, not from products.json
+    monkeypatch.setattr(inventory, "_start_sweeper", lambda: None)
+
+    def seed(pid, on_hand):
+        inventory._conn().execute(
+            "INSERT INTO stock (product_id, on_hand, reserved, seeded) VALUES (?, ?, 0, ?)", (pid, on_hand, on_hand)
+        )
+    return seed
+
+def _stock_row(pid):
+    return inventory._conn().execute("SELECT on_hand, reserved FROM stock WHERE product_id = ?", (pid,)).fetchone()
+
+def test_only_one_reservation_gets_the_last_unit(stock, race):
+    stock("gin", 1)
+    counter = iter(range(100))
+    results = race(lambda: inventory.reserve(f"order-{next(counter)}", {"gin": 1}))
+    assert sum(1 for short in results if short == {}) == 1
+    assert all(short in ({}, {"gin": 0}) for short in results)
+    assert _stock_row("gin") == (1, 1)
+    assert inventory.available() == {"gin": 0}
+
+def test_reservation_is_all_or_nothing(stock):
+    stock("gin", 3)
+    stock("rum", 1)
+    assert inventory.reserve("a", {"rum": 1}) == {}
+    assert inventory.reserve("b", {"gin": 2, "rum": 1}) == {"rum": 0}
+    assert _stock_row("gin") == (3, 0)
+
+def test_sweep_returns_expired_holds_to_stock(stock):
+    stock("gin", 2)
+    assert inventory.reserve("late", {"gin": 2}, ttl=-1) == {}
+    assert inventory.reserve("on-time", {"gin": 1}) == {"gin": 0}
+    assert inventory.sweep() == 1
+    assert _stock_row("gin") == (2, 0)
+    assert inventory.reserve("on-time", {"gin": 1}) == {}
+    assert inventory.sweep() == 0
+
+def test_commit_after_expiry_still_takes_stock(stock):
+    stock("gin", 2)
+    inventory.reserve("slow-payer", {"gin": 1}, ttl=-1)
+    inventory.sweep()
+    inventory.commit("slow-payer")
+    assert _stock_row("gin") == (1, 0)
+    inventory.commit("slow-payer")  # a repeated success callback changes nothing
+    assert _stock_row("gin") == (1, 0)
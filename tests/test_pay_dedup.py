@@ -0,0 +1,26 @@
+import pytest
+
+from services import pay_dedup
+
+@pytest.fixture(autouse=True)
+def dedup_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(pay_dedup, "PAY_DEDUP_DB", str(tmp_path / "pay_dedup.sqlite3"))
+
+def _fp():
+    return pay_dedup.fingerprint("tok", {"gin": 1}, 45000, "pickup", 0)
+
+def test_only_one_double_submit_starts_a_checkout(race):
+    results = race(lambda: pay_dedup.claim(_fp(), "tok"))
+    assert sorted(outcome for outcome, _ in results) == ["busy"] * 7 + ["start"]
+
+def test_repeat_after_start_replays_the_checkout():
+    assert pay_dedup.claim(_fp(), "tok") == ("start", None)
+    pay_dedup.complete(_fp(), "https://pay.example/1")
+    assert pay_dedup.claim(_fp(), "tok") == ("replay", "https://pay.example/1")
+    assert pay_dedup.wait_for(_fp(), timeout=0.5) == "https://pay.example/1"
+
+def test_failed_start_frees_the_claim():
+    pay_dedup.claim(_fp(), "tok")
+    pay_dedup.release(_fp())
+    assert pay_dedup.wait_for(_fp(), timeout=0.5) is None
+    assert pay_dedup.claim(_fp(), "tok") == ("start", None)
@@ -0,0 +1,136 @@
+import dataclasses
+import json
+import time
+
+import pytest
+
+import app as shop
+from services import admission, http_client, inventory, orders, pay_dedup, settings, tasks, yoco_webhook
+from services.session_store import MemoryStore, ServerSessionInterface
+
+SECRET = "whsec_" + "c2VjcmV0LWZvci10ZXN0cw=="
+
+class FakeYoco:
+    status_code = 200
+    text = ""
+
+    def __init__(self):
+        self.sent = []
+
+    def __call__(self, url, json=None, **kwargs):
+        self.sent.append(json)
+        return self
+
+    def json(self):
+        return {"id": "ch_1", "redirectUrl": "https://pay.yoco.example/ch_1"}
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    for module, name in ((inventory, "INVENTORY_DB"), (pay_dedup, "PAY_DEDUP_DB"), (orders, "ORDERS_DB"),
+                         (tasks, "TASKS_DB"), (admission, "ADMISSION_DB")):
+        monkeypatch.setattr(module, name, str(tmp_path / f"{name.lower()}.sqlite3"))
+    monkeypatch.setattr(inventory, "sync", lambda snap=None: None)
+    monkeypatch.setattr(orders, "_start_writer", lambda: None)  # the tests flush the journal themselves
+    inventory._conn().execute("INSERT INTO stock (product_id, on_hand, reserved, seeded) VALUES ('gin', 2, 0, 2)")
+    inventory._invalidate()
+    monkeypatch.setattr(shop.app, "session_interface", ServerSessionInterface(MemoryStore(), sweep_interval=0))
+    monkeypatch.setattr(shop, "YOCO_SECRET_KEY", "sk_test_1")
+    monkeypatch.setattr(settings, "_current", dataclasses.replace(settings.current(), yoco_webhook_secret=SECRET))
+    yoco = FakeYoco()
+    monkeypatch.setattr(http_client, "post", yoco)
+    c = shop.app.test_client()
+    c.yoco = yoco
+    return c
+
+def _stock():
+    return inventory._conn().execute("SELECT on_hand, reserved FROM stock WHERE product_id = 'gin'").fetchone()
+
+def _checkout(client, qty=2):
+    if qty:
+        client.post("/cart/add", data={"product_id": "gin", "qty": str(qty)})
+    r = client.post("/pay/yoco/start")
+    assert r.status_code == 302 and r.location == "https://pay.yoco.example/ch_1"
+    return client.yoco.sent[-1]["metadata"]["order_id"]
+
+def _webhook(client, order_id, secret=SECRET, type_="payment.succeeded"):
+    body = json.dumps({"id": "evt_1", "type": type_, "payload": {"id": "p_1", "metadata": {"order_id": order_id}}}).encode()
+    msg_id, ts = "msg_1", str(int(time.time()))
+    headers = {"webhook-id": msg_id, "webhook-timestamp": ts,
+               "webhook-signature": "v1," + yoco_webhook.sign(secret, msg_id, ts, body)}
+    return client.post("/payment/webhook", data=body, headers=headers, content_type="application/json")
+
+def test_return_page_alone_commits_nothing(client):
+    _checkout(client)
+    assert _stock() == (2, 2)
+    client.get("/payment/success")
+    client.get("/payment/success")
+    assert _stock() == (2, 2)
+    inventory.sweep()
+    assert _stock() == (2, 2)  # still held until RESERVATION_TTL, then swept back
+
+def test_signed_webhook_commits_the_order_once(client):
+    order_id = _checkout(client)
+    assert _webhook(client, order_id).status_code == 200
+    assert _webhook(client, order_id).status_code == 200  # Yoco retries
+    assert _stock() == (0, 0)
+
+def test_unsigned_or_forged_webhooks_are_refused(client):
+    order_id = _checkout(client)
+    assert client.post("/payment/webhook", json={"type": "payment.succeeded"}).status_code == 403
+    assert _webhook(client, order_id, secret="whsec_" + "b3RoZXI=").status_code == 403
+    assert _stock() == (2, 2)
+
+def test_payment_after_cancel_page_still_takes_stock(client):
+    order_id = _checkout(client)
+    client.get("/payment/cancel")
+    assert _stock() == (2, 0)
+    _webhook(client, order_id)
+    assert _stock() == (0, 0)
+
+def _journal(order_id):
+    orders._drain()
+    return [row for row in orders.iter_events() if row["order_id"] == order_id]
+
+def test_only_the_webhook_journals_paid_with_the_checkout_cart(client):
+    order_id = _checkout(client)
+    client.post("/cart/add", data={"product_id": "vodka", "qty": "3"})  # another tab, after paying started
+    client.get("/payment/success")
+    assert [row["event"] for row in _journal(order_id)] == ["checkout_started", "returned_success"]
+    _webhook(client, order_id)
+    _journal(order_id)
+    _webhook(client, order_id)
+    paid = [row for row in _journal(order_id) if row["event"] == "paid"]
+    assert len(paid) == 1
+    assert json.loads(paid[0]["items"]) == [["gin", 2, 35000]]
+    assert paid[0]["amount_cents"] == 70000
+
+def _queued():
+    return [json.loads(p) for (p,) in tasks._conn().execute("SELECT payload FROM tasks WHERE name = 'order_webhook'")]
+
+def test_paid_notification_is_queued_once_from_the_webhook(client):
+    order_id = _checkout(client)
+    client.post("/cart/add", data={"product_id": "vodka", "qty": "3"})
+    for page in ("/payment/success", "/payment/failed", "/payment/cancel"):
+        client.get(page)
+    assert _queued() == []
+    orders._drain()
+    _webhook(client, order_id)
+    _webhook(client, order_id)
+    (payload,) = _queued()
+    assert (payload["event"], payload["order_id"], payload["payment_id"]) == ("paid", order_id, "p_1")
+    assert payload["items"] == [["gin", 2, 35000]] and payload["amount_cents"] == 70000
+
+def test_own_hold_is_not_counted_against_the_shopper(client):
+    inventory._conn().execute("UPDATE stock SET on_hand = 3, seeded = 3")
+    first = _checkout(client, qty=2)
+    # back from Yoco without paying: the third bottle is still free for this shopper
+    r = client.post("/cart/add", data={"product_id": "gin", "qty": "1"}, headers={"Accept": "application/json"})
+    assert r.status_code == 200 and r.get_json()["lines"][0]["qty"] == 3
+    assert r.get_json()["lines"][0]["stock_left"] == 3
+    r = client.post("/cart/add", data={"product_id": "gin", "qty": "1"}, headers={"Accept": "application/json"})
+    assert r.status_code == 409
+
+    second = _checkout(client, qty=None)  # pay again for the bigger cart
+    assert second != first
+    assert inventory.held(first) == {} and inventory.held(second) == {"gin": 3}
+    assert _stock() == (3, 3)
@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+from services import quoting
+from services.carriers import RateQuote
+
+class Carrier:
+    def __init__(self, name, delay=0.0):
+        self.NAME = name
+        self.delay = delay
+        self.calls = 0
+
+    def enabled(self):
+        return True
+
+    def fetch(self, delivery_address, lines, declared_value):
+        self.calls += 1
+        time.sleep(self.delay)
+        return [RateQuote(self.NAME, "Economy", 10000, "", "")]
+
+@pytest.fixture
+def carriers(monkeypatch):
+    registry = {}
+    monkeypatch.setattr(quoting, "CARRIERS", registry)
+    monkeypatch.setattr(quoting, "QUOTE_CARRIERS", [])
+    monkeypatch.setattr(quoting, "_pools", {})
+    monkeypatch.setattr(quoting, "_refreshing", set())
+    return registry
+
+def test_merges_carriers_and_reports_the_slow_one(carriers):
+    carriers["fast"] = Carrier("fast")
+    carriers["slow"] = Carrier("slow", delay=0.3)
+    rates, errors = quoting.quote_all({}, [], 500, deadline=0.1)
+    assert [q.carrier for q in rates] == ["fast"]
+    assert errors == {"slow": "timed out"}
+
+def test_work_queued_past_the_deadline_never_runs(carriers, monkeypatch):
+    monkeypatch.setattr(quoting, "QUOTE_MAX_WORKERS", 1)
+    carriers["slow"] = Carrier("slow", delay=0.3)
+    quoting.quote_all({}, [], 500, deadline=0.05)  # takes the only thread
+    quoting.quote_all({}, [], 500, deadline=0.05)  # queued behind it, then abandoned
+    time.sleep(0.4)
+    assert carriers["slow"].calls == 1
+
+def test_refreshes_run_on_their_own_bounded_pool(carriers, monkeypatch):
+    monkeypatch.setattr(quoting, "QUOTE_REFRESH_QUEUE", 1)
+    release = threading.Event()
+    carriers["down"] = Carrier("down")
+    carriers["down"].fetch = lambda *args: release.wait(1) and []
+    quoting._refresh_later("down", {"code": "1"}, [], 500)
+    quoting._refresh_later("down", {"code": "2"}, [], 500)  # over the bound: dropped
+    assert len(quoting._refreshing) == 1
+    assert set(quoting._pools) == {"quote-refresh"}
+    release.set()
@@ -0,0 +1,44 @@
+from services.carriers import RateQuote
+from services.rate_cache import RateCache, cache_key, decode_quotes
+
+def test_lru_evicts_the_least_recently_used():
+    cache = RateCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+def test_entries_expire():
+    cache = RateCache(maxsize=4, ttl=60)
+    cache.set("a", 1, ttl=-1)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+def test_shared_backend_is_seen_by_other_workers(tmp_path):
+    path = str(tmp_path / "rate_cache.sqlite3")
+    mine, theirs = RateCache(maxsize=4, db_path=path), RateCache(maxsize=4, db_path=path)
+    mine.set("a", {"rates": [{"rate": 120}]})
+    assert theirs.get("a") == {"rates": [{"rate": 120}]}
+    assert theirs.stats()["shared_hits"] == 1
+
+def test_key_ignores_street_and_spacing():
+    a = {"type": "residential", "zone": "Gauteng", "code": "2196", "city": "Sandton", "local_area": "Morningside",
+         "street_address": "1 Main Rd", "country": "ZA", "_total_qty": 2}
+    b = dict(a, street_address="99 Other St", city="  sandton ")
+    assert cache_key(a, 900, "2026-10-18") == cache_key(b, 900, "2026-10-18")
+    assert cache_key(a, 900, "2026-10-18") != cache_key(dict(a, _total_qty=3), 900, "2026-10-18")
+
+def test_shared_values_come_back_as_quotes(tmp_path):
+    path = str(tmp_path / "rate_cache.sqlite3")
+    quotes = (RateQuote("shiplogic", "Economy", 12250, "2026-10-20", "ECO"),)
+    RateCache(db_path=path, decode=decode_quotes).set("a", quotes)
+    assert RateCache(db_path=path, decode=decode_quotes).get("a") == quotes
+    assert isinstance(RateCache(db_path=path, decode=decode_quotes).get("a")[0], RateQuote)
+
+def test_old_raw_json_rows_are_misses(tmp_path):
+    path = str(tmp_path / "rate_cache.sqlite3")
+    RateCache(db_path=path).set("a", {"rates": [{"rate": 120}]})
+    assert RateCache(db_path=path, decode=decode_quotes).get("a") is None
@@ -0,0 +1,62 @@
+import pytest
+from flask import Flask, session
+
+from services.session_store import MemoryStore, ServerSessionInterface, SQLiteStore
+
+def _app(store):
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.session_interface = ServerSessionInterface(store, ttl=3600, sweep_interval=0)
+
+    @app.route("/set/<value>")
+    def set_value(value):
+        session["cart"] = {"gin": int(value)}
+        return "ok"
+
+    @app.route("/get")
+    def get_value():
+        return str(session.get("cart", {}).get("gin", 0))
+
+    @app.route("/static-ish")
+    def untouched():
+        return "ok"
+
+    @app.route("/clear")
+    def clear():
+        session.clear()
+        return "ok"
+    return app
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    return MemoryStore() if request.param == "memory" else SQLiteStore(str(tmp_path / "sessions.sqlite3"))
+
+def test_cookie_carries_only_an_id(store):
+    client = _app(store).test_client()
+    response = client.get("/set/2")
+    cookie = response.headers["Set-Cookie"]
+    assert "gin" not in cookie
+    assert client.get("/get").get_data(as_text=True) == "2"
+
+def test_untouched_session_is_not_read_or_written(store):
+    client = _app(store).test_client()
+    response = client.get("/static-ish")
+    assert "Set-Cookie" not in response.headers
+    assert "Cookie" not in response.vary
+
+def test_unknown_id_starts_a_new_session(store):
+    client = _app(store).test_client()
+    client.set_cookie("session", "x" * 43)
+    assert client.get("/get").get_data(as_text=True) == "0"
+
+def test_clearing_deletes_the_stored_session(store):
+    client = _app(store).test_client()
+    client.get("/set/1")
+    client.get("/clear")
+    assert client.get("/get").get_data(as_text=True) == "0"
+
+def test_sweep_drops_expired_sessions(store):
+    store.save("old", "{}", 0)
+    store.save("new", "{}", 2 ** 40)
+    assert store.sweep() == 1
+    assert store.load("old") is None and store.load("new") is not None
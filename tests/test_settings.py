@@ -0,0 +1,42 @@
+import pytest
+
+from services import settings
+
+@pytest.fixture
+def env_file(tmp_path, monkeypatch):
+    # reload() writes into os.environ and the module's current settings; put both back afterwards
+    monkeypatch.setattr(settings, "_current", settings.current())
+    monkeypatch.setattr(settings, "_listeners", [])
+    for name in ("WHATSAPP_NUMBER", "LOW_STOCK"):
+        monkeypatch.setenv(name, str(getattr(settings.current(), name.lower())))
+    path = tmp_path / ".env"
+    return path
+
+def test_bad_values_are_all_reported_at_once():
+    with pytest.raises(settings.ConfigError) as e:
+        settings.from_env({"WHATSAPP_NUMBER": "+27 64", "LOW_STOCK": "lots", "PUBLIC_URL": "example.com"})
+    message = str(e.value)
+    assert "WHATSAPP_NUMBER" in message and "LOW_STOCK" in message and "PUBLIC_URL" in message
+
+def test_webhook_must_be_https_except_locally():
+    with pytest.raises(settings.ConfigError):
+        settings.from_env({"ORDER_WEBHOOK_URL": "http://hooks.example.com/orders"})
+    assert settings.from_env({"ORDER_WEBHOOK_URL": "http://127.0.0.1:9000/x"}).order_webhook_url
+
+def test_settings_are_frozen():
+    with pytest.raises(AttributeError):
+        settings.current().low_stock = 1
+
+def test_reload_swaps_settings_and_tells_listeners(env_file):
+    env_file.write_text("LOW_STOCK=3\nWHATSAPP_NUMBER=27820000000\n")
+    seen = []
+    settings.on_reload(seen.append)
+    assert settings.reload(str(env_file)) is True
+    assert settings.current().low_stock == 3
+    assert seen == [settings.current()]
+
+def test_invalid_reload_keeps_the_running_settings(env_file):
+    before = settings.current()
+    env_file.write_text("LOW_STOCK=-1\n")
+    assert settings.reload(str(env_file)) is False
+    assert settings.current() is before
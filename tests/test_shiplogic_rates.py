@@ -0,0 +1,31 @@
+import pytest
+
+from services import shiplogic_rates
+from services.carriers import RateQuote
+from services.rate_cache import RateCache, decode_quotes
+
+ADDRESS = {"type": "residential", "street_address": "1 Rd", "local_area": "Morningside", "city": "Sandton",
+           "zone": "Gauteng", "country": "ZA", "code": "2196"}
+
+class Answer:
+    status_code = 200
+    text = ""
+
+    def json(self):
+        return {"rates": [{"rate": 122.5, "service_level": {"name": "Economy", "code": "ECO"}}, {"rate": None}]}
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = []
+    monkeypatch.setattr(shiplogic_rates, "quote_cache", RateCache(decode=decode_quotes))
+    monkeypatch.setattr(shiplogic_rates, "last_good", RateCache(decode=decode_quotes))
+    monkeypatch.setattr(shiplogic_rates, "api_key", lambda: "k")
+    monkeypatch.setattr(shiplogic_rates, "_post_rates", lambda payload, headers: calls.append(payload) or Answer())
+    return calls
+
+def test_answers_are_parsed_once_and_cached_as_quotes(upstream):
+    first = shiplogic_rates.get_rates(dict(ADDRESS, _total_qty=2), declared_value=700)
+    again = shiplogic_rates.get_rates(dict(ADDRESS, _total_qty=2), declared_value=700)
+    assert first == again == (RateQuote("shiplogic", "Economy", 12250, "", "ECO"),)
+    assert len(upstream) == 1
+    assert shiplogic_rates.last_good_rates("Gauteng", 3) == first  # same 2-3 bottle band
@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+from services import tasks
+
+@pytest.fixture(autouse=True)
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(tasks, "TASKS_DB", str(tmp_path / "tasks.sqlite3"))
+    monkeypatch.setitem(tasks.HANDLERS, "t_test", tasks.Handler(lambda payload: None, 2, 3, 60))
+
+def test_each_task_is_claimed_once(race):
+    for i in range(3):
+        tasks.enqueue("t_test", {"i": i})
+    counter = iter(range(100))
+    claimed = [c for c in race(lambda: tasks.claim("t_test", f"w{next(counter)}")) if c is not None]
+    # concurrency=2 caps how many run at once, whoever asks
+    assert len(claimed) == 2
+    assert len({task_id for task_id, _, _ in claimed}) == 2
+
+def test_lapsed_lease_is_claimed_again():
+    tasks.enqueue("t_test", {"i": 1}, key="only")
+    task_id, _, attempts = tasks.claim("t_test", "w1")
+    assert attempts == 1
+    assert tasks.claim("t_test", "w2") is None
+    tasks._conn().execute("UPDATE tasks SET locked_until = ? WHERE id = ?", (time.time() - 1, task_id))
+    assert tasks.claim("t_test", "w2") == (task_id, {"i": 1}, 2)
+    # the first worker's lease is gone, so its result is ignored
+    tasks._finish(task_id, "w1", "UPDATE tasks SET status = 'done', finished_at = ?", (time.time(),))
+    assert tasks._conn().execute("SELECT status, locked_by FROM tasks WHERE id = ?", (task_id,)).fetchone() == ("running", "w2")
+
+def test_enqueue_with_a_key_is_idempotent():
+    assert tasks.enqueue("t_test", {"i": 1}, key="order-1") is True
+    assert tasks.enqueue("t_test", {"i": 1}, key="order-1") is False
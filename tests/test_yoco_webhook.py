@@ -0,0 +1,27 @@
+import time
+
+from services import yoco_webhook
+
+SECRET = "whsec_" + "c2VjcmV0LWZvci10ZXN0cw=="
+
+def _headers(body, ts=None, secret=SECRET):
+    ts = str(int(time.time()) if ts is None else ts)
+    return {"webhook-id": "msg_1", "webhook-timestamp": ts,
+            "webhook-signature": "v1," + yoco_webhook.sign(secret, "msg_1", ts, body)}
+
+def test_valid_signature_is_accepted():
+    assert yoco_webhook.verify(SECRET, _headers(b'{"a":1}'), b'{"a":1}')
+
+def test_any_of_several_signatures_may_match():
+    headers = _headers(b"{}")
+    headers["webhook-signature"] = "v1,bm9wZQ== " + headers["webhook-signature"]
+    assert yoco_webhook.verify(SECRET, headers, b"{}")
+
+def test_changed_body_or_other_secret_is_refused():
+    assert not yoco_webhook.verify(SECRET, _headers(b'{"a":1}'), b'{"a":2}')
+    assert not yoco_webhook.verify(SECRET, _headers(b"{}", secret="whsec_b3RoZXI="), b"{}")
+
+def test_old_calls_and_missing_secret_are_refused():
+    assert not yoco_webhook.verify(SECRET, _headers(b"{}", ts=time.time() - 3600), b"{}")
+    assert not yoco_webhook.verify("", _headers(b"{}"), b"{}")
+    assert not yoco_webhook.verify(SECRET, {}, b"{}")
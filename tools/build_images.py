@@ -0,0 +1,130 @@
+"""
+Builds responsive variants of the photos in static/img.
+
+    python tools/build_images.py            # after changing images; run in the build step
+    python tools/build_images.py --force    # rebuild everything
+
+Each source image gets AVIF (when Pillow supports it), WebP and JPEG copies
+at the WIDTHS below (never upscaled), named by content hash, in
+static/img/build/, plus static/img/build/manifest.json. The templates read
+the manifest to emit srcset/sizes. Sources whose bytes and settings match the
+manifest are skipped, so a rerun only pays for what changed.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    print("ERROR: Pillow is required (pip install -r requirements.txt)")
+    sys.exit(2)
+
+ROOT = Path(__file__).resolve().parent.parent
+STATIC = ROOT / "static"
+SOURCE_DIR = STATIC / "img"
+OUT_DIR = SOURCE_DIR / "build"
+MANIFEST = OUT_DIR / "manifest.json"
+
+WIDTHS = (320, 480, 640, 960, 1280)
+QUALITY = {"avif": 50, "webp": 72, "jpeg": 78}
+SOURCE_TYPES = (".jpg", ".jpeg", ".png")
+
+def formats() -> list:
+    out = ["avif"] if features.check("avif") else []
+    return out + ["webp", "jpeg"]
+
+def settings_signature() -> str:
+    return hashlib.sha1(json.dumps([WIDTHS, QUALITY, formats()]).encode("utf-8")).hexdigest()[:12]
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def encode(img, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "jpeg":
+        img.convert("RGB").save(buf, "JPEG", quality=QUALITY["jpeg"], optimize=True, progressive=True)
+    elif fmt == "webp":
+        img.save(buf, "WEBP", quality=QUALITY["webp"], method=6)
+    else:
+        img.save(buf, "AVIF", quality=QUALITY["avif"])
+    return buf.getvalue()
+
+def build_one(src: Path) -> dict:
+    with Image.open(src) as opened:
+        img = ImageOps.exif_transpose(opened)
+        img.load()
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+    width, height = img.size
+    widths = [w for w in WIDTHS if w < width] + [min(width, WIDTHS[-1])]
+    widths = sorted(set(widths))
+
+    variants = {}
+    for w in widths:
+        h = round(height * w / width)
+        resized = img if w == width else img.resize((w, h), Image.LANCZOS)
+        for fmt in formats():
+            blob = encode(resized, fmt)
+            ext = "jpg" if fmt == "jpeg" else fmt
+            name = f"{src.stem}-{w}.{hashlib.sha1(blob).hexdigest()[:10]}.{ext}"
+            (OUT_DIR / name).write_bytes(blob)
+            variants.setdefault(fmt, []).append([w, f"img/build/{name}"])
+    return {"width": width, "height": height, "variants": variants}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--force", action="store_true", help="rebuild every image")
+    args = ap.parse_args()
+
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        old = json.loads(MANIFEST.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        old = {}
+    signature = settings_signature()
+    old_images = old.get("images", {}) if old.get("settings") == signature and not args.force else {}
+
+    images = {}
+    built = skipped = 0
+    for src in sorted(SOURCE_DIR.iterdir()):
+        if not src.is_file() or src.suffix.lower() not in SOURCE_TYPES:
+            continue
+        key = f"img/{src.name}"
+        digest = file_hash(src)
+        prev = old_images.get(key)
+        if prev and prev.get("source") == digest and all(
+            (STATIC / path).exists() for items in prev["variants"].values() for _, path in items
+        ):
+            images[key] = prev
+            skipped += 1
+            continue
+        entry = build_one(src)
+        entry["source"] = digest
+        images[key] = entry
+        built += 1
+        print(f"built {key}: {sum(len(v) for v in entry['variants'].values())} variants")
+
+    # drop variants no longer referenced (changed or deleted sources)
+    keep = {path for e in images.values() for items in e["variants"].values() for _, path in items}
+    removed = 0
+    for f in OUT_DIR.iterdir():
+        if f.name != MANIFEST.name and f"img/build/{f.name}" not in keep:
+            f.unlink()
+            removed += 1
+
+    tmp = MANIFEST.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"settings": signature, "images": images}, indent=1), encoding="utf-8")
+    os.replace(tmp, MANIFEST)
+    print(f"{built} built, {skipped} unchanged, {removed} stale files removed")
+
+if __name__ == "__main__":
+    main()
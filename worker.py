@@ -0,0 +1,15 @@
+"""
+Background task worker (the Procfile's `worker` process).
+
+    python worker.py
+"""
+import logging
+
+# settings first: it loads .env into os.environ before other modules read it
+from services import settings
+from services import notify, tasks  # noqa: F401  (notify registers its tasks)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    settings.install_sighup()
+    tasks.run_worker()